@@ -83,3 +83,25 @@ where not exists (select 1 from ai_models where model_id = 'gpt_5_preview');
 insert into ai_models (model_id, name, style, capability_radar)
 select 'qwen_3_max', 'Qwen 3 Max', 'Momentum Algo', '{"Momentum": 9, "Flow": 8, "Trend": 7, "Pattern": 8, "Execution": 6}'
 where not exists (select 1 from ai_models where model_id = 'qwen_3_max');
+
+-- 7. Monte Carlo risk columns (per model per day)
+do $$ 
+begin
+    if not exists (select 1 from information_schema.columns where table_name = 'ai_league_stats' and column_name = 'expected_core_pnl') then
+        alter table ai_league_stats add column expected_core_pnl numeric default 0;
+        alter table ai_league_stats add column core_pnl_p05 numeric default 0;
+        alter table ai_league_stats add column core_pnl_p95 numeric default 0;
+        alter table ai_league_stats add column drawdown_p95 numeric default 0;
+        alter table ai_league_stats add column prob_ruin numeric default 0;
+    end if;
+end $$;
+
+-- 8. LATEST BALANCE PER MODEL (one call instead of one query per model)
+-- p_before = null -> latest row; otherwise the latest row strictly before that date (backfills)
+create or replace function latest_league_balances(p_before date default null)
+returns table (model_id text, date date, wallet_balance numeric) as $$
+    select distinct on (s.model_id) s.model_id, s.date, s.wallet_balance
+    from ai_league_stats s
+    where p_before is null or s.date < p_before
+    order by s.model_id, s.date desc;
+$$ language sql stable;
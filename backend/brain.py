@@ -6,6 +6,7 @@ from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from pathlib import Path
 import db # Import Database Module
+import json_export # Streaming public/*.json snapshots
 import intelligence # Import News Module (Ensure this is here)
 
 # Load environment using pathlib to avoid encoding issues
@@ -341,7 +342,6 @@ def fetch_matches():
                     "date": item['fixture']['date'],
                     "status": item['fixture']['status']['short']
                 })
-                })
                 count += 1
             
             # Save to Cache
@@ -397,6 +397,14 @@ def simulate_prediction(model_name, match_info=None):
             f"This fixture aligns perfectly with {home}'s strengths.",
             f"We are detecting a massive divergence in {home}'s real value."
         ]
+        subject = home if prediction != "Away Win" else away
+        # Stable per (model, fixture, pick) so a rerun reads the same line
+        digest = int(hashlib.md5(f"{model_name}|{home}|{away}|{prediction}".encode('utf-8')).hexdigest(), 16)
+        return intros[digest % len(intros)].replace(home, subject)
+
+    logic = generate_combinatorial_logic(pred, home_team, away_team)
+    return {"score": score, "prediction": pred, "logic": logic, "confidence": random.randint(60, 92)}
+
 # --- QUANTGOAL AI v4.0: INSTITUTIONAL QUANT ENGINE (ULTIMATE) ---
 
 QUANT_SYSTEM_PROMPT = """
@@ -583,8 +591,6 @@ def call_real_model_api(model_name, match_info, prediction_Label):
                 return clean_json(r.json()['choices'][0]['message']['content'])
         except Exception as e: print(e)
 
-    return None
-
     # 5. QWEN (Real - OpenAI Compatible)
     elif "Qwen" in model_name:
         key = os.getenv("DASHSCOPE_API_KEY")
@@ -593,7 +599,7 @@ def call_real_model_api(model_name, match_info, prediction_Label):
         payload = {
             "model": "qwen-max",
             "messages": [
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": QUANT_SYSTEM_PROMPT},
                 {"role": "user", "content": full_user_prompt}
             ]
         }
@@ -611,7 +617,7 @@ def call_real_model_api(model_name, match_info, prediction_Label):
         payload = {
             "model": "grok-2-latest", 
             "messages": [
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": QUANT_SYSTEM_PROMPT},
                 {"role": "user", "content": full_user_prompt}
             ]
         }
@@ -998,6 +1004,17 @@ def call_openai(prompt): return wrapper_call("ChatGPT-4o", prompt)
 def call_grok(prompt): return wrapper_call("Grok 3 (Beta)", prompt)
 def call_qwen(prompt): return wrapper_call("Qwen 2.5 Max", prompt)
 
+def _save_slate(slate):
+    """Persists a whole cycle in one transaction: one integrity batch, one Merkle root."""
+    if not slate:
+        return
+    try:
+        counts = db.save_slate(slate)
+        print(f"DB: saved {counts['matches']} matches, {counts['predictions']} predictions, {counts['consensus_signals']} signals.")
+        print(f"DB: cycle Merkle root {counts['merkle_root']}")
+    except Exception as e:
+        print(f"DB Error: {e}")
+
 def process_matches():
     # Ensure DB is ready
     db.init_db()
@@ -1037,81 +1054,81 @@ def process_matches():
         
     print(f"Found {len(matches)} matches.")
     
-    results = []
-    
-    for match in matches:
-        print(f"Analyzing {match['home_team']} vs {match['away_team']}...")
+    slate = [] # Persisted in one bulk transaction when the cycle ends (also if it ends early)
+
+    # Matches are streamed to the JSON view layer as they are analysed
+    try:
+        with json_export.JsonArrayWriter(json_export.public_path('matches_data.json'), pretty=True) as out:
+            for match in matches:
+                print(f"Analyzing {match['home_team']} vs {match['away_team']}...")
         
-        # 0. Simulate/Fetch Odds for this match
-        odds = get_live_odds(match)
+                # 0. Simulate/Fetch Odds for this match
+                odds = get_live_odds(match)
         
-        # 0.5. FETCH INTELLIGENCE (NEW)
-        # Verify if we should fetch news (can be slow, maybe limit to top leagues)
-        news_briefing = intelligence.get_match_briefing(match['home_team'], match['away_team'])
+                # 0.5. FETCH INTELLIGENCE (NEW)
+                # Verify if we should fetch news (can be slow, maybe limit to top leagues)
+                news_briefing = intelligence.get_match_briefing(match['home_team'], match['away_team'])
         
-        # 1. Generate Contextual Prompts & Calls
-        # ChatGPT (General)
-        prompt_gpt = get_match_data_prompt("General Analyst", { "home_team": match['home_team'], "away_team": match['away_team'], "league": match['league'] }, news_context=news_briefing)
-        res_gpt = call_openai(prompt_gpt)
-        p1 = { "model": "ChatGPT-4o", "prediction": res_gpt.get('score', 'N/A'), "logic": res_gpt.get('logic', 'N/A'), "confidence": res_gpt.get('confidence', 0), "winner": res_gpt.get('prediction', '') }
-
-        # Gemini (General)
-        prompt_gem = get_match_data_prompt("General Analyst", { "home_team": match['home_team'], "away_team": match['away_team'], "league": match['league'] }, news_context=news_briefing)
-        res_gem = call_gemini(prompt_gem)
-        p2 = { "model": "Gemini 3 Pro", "prediction": res_gem.get('score', 'N/A'), "logic": res_gem.get('logic', 'N/A'), "confidence": res_gem.get('confidence', 0), "winner": res_gem.get('prediction', '') }
+                # 1. Generate Contextual Prompts & Calls
+                # ChatGPT (General)
+                prompt_gpt = get_match_data_prompt("General Analyst", { "home_team": match['home_team'], "away_team": match['away_team'], "league": match['league'] }, news_context=news_briefing)
+                res_gpt = call_openai(prompt_gpt)
+                p1 = { "model": "ChatGPT-4o", "prediction": res_gpt.get('score', 'N/A'), "logic": res_gpt.get('logic', 'N/A'), "confidence": res_gpt.get('confidence', 0), "winner": res_gpt.get('prediction', '') }
+
+                # Gemini (General)
+                prompt_gem = get_match_data_prompt("General Analyst", { "home_team": match['home_team'], "away_team": match['away_team'], "league": match['league'] }, news_context=news_briefing)
+                res_gem = call_gemini(prompt_gem)
+                p2 = { "model": "Gemini 3 Pro", "prediction": res_gem.get('score', 'N/A'), "logic": res_gem.get('logic', 'N/A'), "confidence": res_gem.get('confidence', 0), "winner": res_gem.get('prediction', '') }
         
-        # DeepSeek (Tactical Expert)
-        prompt_ds = get_match_data_prompt("Tactical Expert", { "home_team": match['home_team'], "away_team": match['away_team'], "league": match['league'] }, news_context=news_briefing)
-        res_ds = call_deepseek(prompt_ds)
-        p3 = { "model": "DeepSeek V3", "prediction": res_ds.get('score', 'N/A'), "logic": res_ds.get('logic', 'N/A'), "confidence": res_ds.get('confidence', 0), "winner": res_ds.get('prediction', '') }
+                # DeepSeek (Tactical Expert)
+                prompt_ds = get_match_data_prompt("Tactical Expert", { "home_team": match['home_team'], "away_team": match['away_team'], "league": match['league'] }, news_context=news_briefing)
+                res_ds = call_deepseek(prompt_ds)
+                p3 = { "model": "DeepSeek V3", "prediction": res_ds.get('score', 'N/A'), "logic": res_ds.get('logic', 'N/A'), "confidence": res_ds.get('confidence', 0), "winner": res_ds.get('prediction', '') }
         
-        # Grok (Value Hunter / Contrarian)
-        prompt_grok = get_match_data_prompt("Value Hunter", { "home_team": match['home_team'], "away_team": match['away_team'], "league": match['league'] }, news_context=news_briefing)
-        res_grok = call_grok(prompt_grok)
-        p4 = { "model": "Grok 3 (Beta)", "prediction": res_grok.get('score', 'N/A'), "logic": res_grok.get('logic', 'N/A'), "confidence": res_grok.get('confidence', 0), "winner": res_grok.get('prediction', '') }
-
-        # Claude (Bias Detector / Safe)
-        prompt_claude = get_match_data_prompt("Bias Detector", { "home_team": match['home_team'], "away_team": match['away_team'], "league": match['league'] }, news_context=news_briefing)
-        res_claude = call_claude(prompt_claude)
-        p5 = { "model": "Claude 3.5 Opus", "prediction": res_claude.get('score', 'N/A'), "logic": res_claude.get('logic', 'N/A'), "confidence": res_claude.get('confidence', 0), "winner": res_claude.get('prediction', '') }
-
-        # Qwen (Data Quant)
-        prompt_qwen = get_match_data_prompt("Data Quant", { "home_team": match['home_team'], "away_team": match['away_team'], "league": match['league'] }, news_context=news_briefing)
-        res_qwen = call_qwen(prompt_qwen)
-        p6 = { "model": "Qwen 2.5 Max", "prediction": res_qwen.get('score', 'N/A'), "logic": res_qwen.get('logic', 'N/A'), "confidence": res_qwen.get('confidence', 0), "winner": res_qwen.get('prediction', '') }
+                # Grok (Value Hunter / Contrarian)
+                prompt_grok = get_match_data_prompt("Value Hunter", { "home_team": match['home_team'], "away_team": match['away_team'], "league": match['league'] }, news_context=news_briefing)
+                res_grok = call_grok(prompt_grok)
+                p4 = { "model": "Grok 3 (Beta)", "prediction": res_grok.get('score', 'N/A'), "logic": res_grok.get('logic', 'N/A'), "confidence": res_grok.get('confidence', 0), "winner": res_grok.get('prediction', '') }
+
+                # Claude (Bias Detector / Safe)
+                prompt_claude = get_match_data_prompt("Bias Detector", { "home_team": match['home_team'], "away_team": match['away_team'], "league": match['league'] }, news_context=news_briefing)
+                res_claude = call_claude(prompt_claude)
+                p5 = { "model": "Claude 3.5 Opus", "prediction": res_claude.get('score', 'N/A'), "logic": res_claude.get('logic', 'N/A'), "confidence": res_claude.get('confidence', 0), "winner": res_claude.get('prediction', '') }
+
+                # Qwen (Data Quant)
+                prompt_qwen = get_match_data_prompt("Data Quant", { "home_team": match['home_team'], "away_team": match['away_team'], "league": match['league'] }, news_context=news_briefing)
+                res_qwen = call_qwen(prompt_qwen)
+                p6 = { "model": "Qwen 2.5 Max", "prediction": res_qwen.get('score', 'N/A'), "logic": res_qwen.get('logic', 'N/A'), "confidence": res_qwen.get('confidence', 0), "winner": res_qwen.get('prediction', '') }
         
-        all_models = [p1, p2, p3, p4, p5, p6]
+                all_models = [p1, p2, p3, p4, p5, p6]
         
-        # Run Proprietary Algo (Financial Logic)
-        consensus_data = consensus_engine(all_models, odds)
+                # Run Proprietary Algo (Financial Logic)
+                consensus_data = consensus_engine(all_models, odds)
         
-        # --- PERSISTENCE LAYER ---
-        # Save to DB for history tracking
-        try:
-            db_match_info = {
-                "fixture_id": match['fixture_id'],
-                "league": match['league'],
-                "home": match['home_team'],
-                "away": match['away_team'],
-                "date": match['date'],
-                "status": match['status']
-            }
-            db.save_match_and_predictions(db_match_info, all_models, consensus_data, odds)
-        except Exception as e:
-            print(f"DB Error: {e}")
-        # -------------------------
-
-        results.append({
-            "match_info": match,
-            "consensus": consensus_data,
-            "models": all_models,
-            "odds": odds 
-        })
+                # --- PERSISTENCE LAYER ---
+                # Queue for the next bulk save (history tracking)
+                db_match_info = {
+                    "fixture_id": match['fixture_id'],
+                    "league": match['league'],
+                    "home": match['home_team'],
+                    "away": match['away_team'],
+                    "date": match['date'],
+                    "status": match['status']
+                }
+                slate.append((db_match_info, all_models, consensus_data, odds))
+                # -------------------------
+
+                out.write({
+                    "match_info": match,
+                    "consensus": consensus_data,
+                    "models": all_models,
+                    "odds": odds 
+                })
+        
+    finally:
+        # Whatever was analysed before an error is still persisted
+        _save_slate(slate)
         
-    # Save to JSON (View Layer)
-    output_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'public', 'matches_data.json')
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
     print("Analysis Complete. QuantGoal v2.0 Data saved to DB and JSON.")
 
 if __name__ == "__main__":
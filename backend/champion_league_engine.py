@@ -1,12 +1,25 @@
 import os
 import random
+import numpy as np
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from supabase import create_client, Client
+from framework.league_simulator import LeagueMonteCarloSimulator
+import supabase_reader
 
 # Load Env
 load_dotenv(dotenv_path='backend/.env')
 
+MC_PATHS = 5000 # Monte Carlo paths per model per day
+INITIAL_BALANCE = 10000.0
+UPSERT_CHUNK_SIZE = 500
+ID_FILTER_CHUNK_SIZE = 150 # Values per .in_() filter: keeps the GET URL well under server limits
+MODEL_COLUMNS = 'model_id, name'
+SIGNAL_COLUMNS = 'id, match_time, quant_analysis' # Never pull odds_data / models_data
+BLACK_SWAN_XP = 200 # Per triggered option with a payout
+UNDERDOG_PROB = 0.4 # God Slayer: a win priced below this probability
+IRON_SHIELD_WINS = 5
+
 class ChampionLeagueEngine:
     def __init__(self):
         url: str = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
@@ -30,6 +43,8 @@ class ChampionLeagueEngine:
                 {'model_id': 'gemini_2_flash', 'name': 'Gemini 2.0 Flash', 'style': 'Speed Trader', 'capability_radar': '{"Speed": 10, "Volume": 9, "Latency": 10, "Data": 8, "Alpha": 7}'}
             ]
             self.supabase.table('ai_models').insert(models).execute()
+
+    def run_daily_simulation(self):
         """
         Simulate a full day of betting for all models using real AI signals from Supabase.
         """
@@ -37,79 +52,48 @@ class ChampionLeagueEngine:
         print(f"[LEAGUE] Running Supabase simulation for {today}...")
         
         # 1. Fetch AI Models
-        models_res = self.supabase.table('ai_models').select('*').execute()
+        models_res = self.supabase.table('ai_models').select(MODEL_COLUMNS).execute()
         models = models_res.data
         
         if not models:
             print("No models found in ai_models table.")
             return
 
-        # 2. Fetch Signals (Matches with quant_analysis)
-        # For simulation, we fetch recent matches that have analysis
-        signals_res = self.supabase.table('matches').select('*').limit(20).execute()
-        signals = signals_res.data
+        # 2. Stream today's Signals (Matches with quant_analysis) straight into the book
+        book = self._build_signal_book(self._stream_signals(today, today))
         
-        if not signals:
+        if not book['match_ids']:
             print("No signal data found in Supabase. Skipping simulation.")
             return
 
-        daily_performers = []
+        # Balances as of the previous day, so rerunning today overwrites instead of compounding
+        last_balances = self._get_last_balances(before=today)
+        balances = [last_balances.get(m['model_id'], INITIAL_BALANCE) for m in models]
 
-        for model in models:
-            perf = self._process_model_day(model, signals, today)
-            daily_performers.append(perf)
+        daily_performers, stat_rows, _ = self._simulate_day(models, book, balances, today)
+        self._upsert_stats(stat_rows)
 
         # 3. Handle Governance & RPG Evolution
-        self._settle_black_swan_options(signals)
+        self._settle_black_swan_options(book)
         self._award_achievements(daily_performers, today)
         self._process_governance(today)
         # 4. Update Guild Stats
-        self._update_guild_stats(daily_performers)
+        self._update_guild_stats(today)
         
         # 5. Generate Daily News
         self._generate_daily_news(daily_performers, today)
         print("[LEAGUE] Simulation complete. Data synced to Supabase.")
 
     def _process_governance(self, today):
-        """Lifecycle of proposals."""
+        """Lifecycle of proposals: one transactional RPC closes every expired proposal."""
         try:
-            # 1. Tally and Execute Expired Proposals
-            res = self.supabase.table('governance_proposals') \
-                .select('*') \
-                .eq('status', 'ACTIVE') \
-                .lte('expires_at', today) \
-                .execute()
-            
-            for prop in res.data:
-                yes = float(prop.get('yes_votes', 0))
-                no = float(prop.get('no_votes', 0))
-                threshold = float(prop.get('threshold', 1000))
-                
-                new_status = 'DEFEATED'
-                if yes > no and yes >= threshold:
-                    new_status = 'EXECUTED'
-                    # Set active window (e.g. for the next 7 days)
-                    self.supabase.table('governance_proposals').update({
-                        "status": "EXECUTED",
-                        "active_from": today,
-                        "active_until": (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
-                    }).eq('id', prop['id']).execute()
-                    print(f"[GOVERNANCE] Proposal '{prop['title']}' PASSED and EXECUTED.")
-                else:
-                    self.supabase.table('governance_proposals').update({"status": new_status}).eq('id', prop['id']).execute()
-                    print(f"[GOVERNANCE] Proposal '{prop['title']}' DEFEATED.")
-
-                # 2. Award XP to all voters of this proposal
-                votes_res = self.supabase.table('governance_votes').select('user_id, power').eq('proposal_id', prop['id']).execute()
-                for v in votes_res.data:
-                    # Award 50 XP per vote or a base amount + scaling?
-                    # Let's do 50 XP base + 1 XP per 100 power spent
-                    xp_bonus = 50 + int(float(v['power']) / 100)
-                    self.supabase.rpc('award_user_xp', {
-                        'p_user_id': v['user_id'],
-                        'p_xp_amount': xp_bonus
-                    }).execute()
-                    print(f"[GOVERNANCE] Awarded {xp_bonus} XP to user {v['user_id']} for voting.")
+            # Tally from governance_votes, flip the status (EXECUTED opens a 7-day active window)
+            # and award voting XP to every voter (50 XP base + 1 XP per 100 power spent), atomically
+            res = self.supabase.rpc('tally_expired_proposals', {'p_today': today}).execute()
+
+            for prop in res.data or []:
+                print(f"[GOVERNANCE] Proposal '{prop['title']}' {'PASSED and EXECUTED' if prop['status'] == 'EXECUTED' else 'DEFEATED'}.")
+                print(f"[GOVERNANCE] Awarded voting XP to {prop.get('voters') or 0} voters.")
 
         except Exception as e:
             print(f"Governance error: {e}")
@@ -133,56 +117,119 @@ class ChampionLeagueEngine:
         except:
             return {}
 
-    def _process_model_day(self, model, signals, date_str):
-        model_id = model['model_id']
-        
-        last_stat = self.supabase.table('ai_league_stats') \
-            .select('wallet_balance') \
-            .eq('model_id', model_id) \
-            .order('date', desc=True) \
-            .limit(1) \
-            .execute()
-        
-        current_balance = 10000.0
-        if last_stat.data:
-            current_balance = float(last_stat.data[0]['wallet_balance'])
-
-        core_pnl = 0
-        total_bets = 0
-        wins = []
-        losses = []
-        
+    def _stream_signals(self, start_date, end_date):
+        """Matches kicking off between start_date and end_date (inclusive), projected and paginated."""
+        until = (datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        return supabase_reader.stream_rows(self.supabase, 'matches', SIGNAL_COLUMNS, filters=[
+            ('gte', 'match_time', start_date),
+            ('lt', 'match_time', until)
+        ])
+
+    def _build_signal_book(self, signals):
+        """Flatten each signal's best bet into arrays for the simulator."""
+        match_ids, probs, odds = [], [], []
         for sig in signals:
             analysis = sig.get('quant_analysis', {})
             if not analysis: continue
-            
+
             best_bet = analysis.get('best_bet', {})
             if not best_bet: continue
-            
-            win_prob = float(best_bet.get('win_rate', 0.5))
-            is_win = random.random() < win_prob
-            
-            stake = 100 
+
             recs = analysis.get('recommendations', {})
-            odds = 1.95
+            price = 1.95
             if best_bet.get('market') in recs:
-                odds = float(recs[best_bet['market']].get('market_odds', 1.95))
-            
-            pnl = (stake * (odds - 1)) if is_win else -stake
-            core_pnl += pnl
-            total_bets += 1
-            
-            if is_win:
-                wins.append({"match_id": sig['id'], "prob": win_prob, "odds": odds})
-            else:
-                losses.append({"match_id": sig['id'], "prob": win_prob})
+                price = float(recs[best_bet['market']].get('market_odds', 1.95))
+
+            match_ids.append(sig['id'])
+            probs.append(float(best_bet.get('win_rate', 0.5)))
+            odds.append(price)
+
+        return {"match_ids": match_ids, "probs": np.array(probs), "odds": np.array(odds)}
+
+    def run_backfill(self, start_date, end_date):
+        """
+        Replays every day in [start_date, end_date] ('YYYY-MM-DD') entirely in memory,
+        chaining wallet balances day to day, then writes all ai_league_stats rows in
+        chunked bulk upserts. Round trips no longer grow with models x days.
+        """
+        models = self.supabase.table('ai_models').select(MODEL_COLUMNS).execute().data
+        if not models:
+            print("[LEAGUE] Nothing to backfill (no models).")
+            return 0
+
+        # One paginated pass over the season's signals, bucketed by kick-off day
+        signals_by_day = {}
+        for sig in self._stream_signals(start_date, end_date):
+            signals_by_day.setdefault((sig.get('match_time') or '')[:10], []).append(sig)
+
+        last_balances = self._get_last_balances(before=start_date)
+        balances = [last_balances.get(m['model_id'], INITIAL_BALANCE) for m in models]
+
+        day = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
+        stat_rows = []
+        while day <= end:
+            date_str = day.strftime('%Y-%m-%d')
+            book = self._build_signal_book(signals_by_day.get(date_str, []))
+            _, rows, balances = self._simulate_day(models, book, balances, date_str)
+            stat_rows.extend(rows)
+            day += timedelta(days=1)
+
+        self._upsert_stats(stat_rows)
+        print(f"[LEAGUE] Backfilled {len(stat_rows)} stat rows from {start_date} to {end_date}.")
+        return len(stat_rows)
+
+    def _simulate_day(self, models, book, balances, date_str):
+        """Monte Carlo over every model x signal, seeded by date so reruns agree. No I/O."""
+        simulator = LeagueMonteCarloSimulator(n_paths=MC_PATHS, stake=100, seed=int(date_str.replace('-', '')))
+        simulation = simulator.simulate([m['model_id'] for m in models], book['probs'], book['odds'], balances)
+
+        performers, stat_rows, new_balances = [], [], []
+        for model, balance in zip(models, balances):
+            perf, stat_entry = self._process_model_day(model, book, simulation[model['model_id']], balance, date_str)
+            performers.append(perf)
+            stat_rows.append(stat_entry)
+            new_balances.append(stat_entry['wallet_balance'])
+        return performers, stat_rows, new_balances
+
+    def _get_last_balances(self, before=None):
+        """Every model's latest wallet_balance in ONE call ({model_id: balance})."""
+        res = self.supabase.rpc('latest_league_balances', {'p_before': before}).execute()
+        return {row['model_id']: float(row['wallet_balance']) for row in res.data or []}
+
+    def _upsert_stats(self, stat_rows):
+        self._bulk_upsert('ai_league_stats', stat_rows, on_conflict='model_id,date')
+
+    def _bulk_upsert(self, table, rows, **kwargs):
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            self.supabase.table(table).upsert(rows[start:start + UPSERT_CHUNK_SIZE], **kwargs).execute()
 
-        challenge_pnl = random.uniform(-50, 80)
-        high_yield_pnl = random.uniform(-100, 150)
+    def _process_model_day(self, model, book, sim, current_balance, date_str):
+        """Builds one model's day (performer summary, ai_league_stats row); the caller persists it."""
+        model_id = model['model_id']
+
+        # The realised day is path 0 of the simulation; the rest feeds the risk stats
+        realised = sim['realised_wins']
+        stake = 100
+        pnl = np.where(realised, stake * (book['odds'] - 1), -stake)
+        core_pnl = float(pnl.sum())
+        total_bets = len(book['match_ids'])
+
+        wins = [
+            {"match_id": book['match_ids'][i], "prob": float(book['probs'][i]), "odds": float(book['odds'][i])}
+            for i in np.flatnonzero(realised)
+        ]
+        losses = [
+            {"match_id": book['match_ids'][i], "prob": float(book['probs'][i])}
+            for i in np.flatnonzero(~realised)
+        ]
+
+        challenge_pnl = sim['challenge_pnl']
+        high_yield_pnl = sim['high_yield_pnl']
         total_day_pnl = core_pnl + challenge_pnl + high_yield_pnl
         new_balance = current_balance + total_day_pnl
 
-        initial_capital = 10000.0
+        initial_capital = INITIAL_BALANCE
         roi = ((new_balance - initial_capital) / initial_capital) * 100
 
         stat_entry = {
@@ -194,12 +241,15 @@ class ChampionLeagueEngine:
             "total_day_pnl": round(total_day_pnl, 2),
             "wallet_balance": round(new_balance, 2),
             "roi": round(roi, 2),
-            "bets_count": total_bets
+            "bets_count": total_bets,
+            "expected_core_pnl": round(sim['expected_pnl'], 2),
+            "core_pnl_p05": round(sim['pnl_quantiles']['p05'], 2),
+            "core_pnl_p95": round(sim['pnl_quantiles']['p95'], 2),
+            "drawdown_p95": round(sim['drawdown_quantiles']['p95'], 4),
+            "prob_ruin": round(sim['prob_ruin'], 4)
         }
         
-        self.supabase.table('ai_league_stats').upsert(stat_entry, on_conflict='model_id,date').execute()
-        
-        return {
+        perf = {
             "model_id": model_id,
             "name": model['name'],
             "pnl": total_day_pnl,
@@ -207,122 +257,114 @@ class ChampionLeagueEngine:
             "wins": wins,
             "losses": losses
         }
+        return perf, stat_entry
 
-    def _settle_black_swan_options(self, signals):
+    def _settle_black_swan_options(self, book):
         """Settle user hedging options based on AI failure in high-prob matches."""
-        # This is a complex join-like operation in code
-        options_res = self.supabase.table('black_swan_options').select('*').eq('status', 'PENDING').execute()
-        options = options_res.data
-        if not options: return
-
-        for opt in options:
-            # Find the match and its result in this day's signals
-            match = next((s for s in signals if s['id'] == opt['match_id']), None)
-            if not match: continue
-
-            # For simulation, we check the model's performance on THIS match
-            # But the simulation is randomized per model run. 
-            # In a real system, the simulation result would be stored per match.
-            # Here we just 're-roll' or check if the 'Black Swan' event occurred.
-            
-            # Logic: If confidence > opt['strike_confidence'] AND AI was WRONG.
-            # We check the quant_analysis of the match.
-            analysis = match.get('quant_analysis', {})
-            best_bet = analysis.get('best_bet', {})
-            win_prob = float(best_bet.get('win_rate', 0.5))
-            
-            if win_prob >= float(opt['strike_confidence']):
-                # In simulation, we check if this match was a 'loss' for a model
-                # Actually, let's keep it simple: If the match exists in the day's signals,
-                # we determine its outcome for the purposes of the option.
-                is_win = random.random() < win_prob # This is the "Truth" for this run
-                
-                if not is_win:
-                    # BLACK SWAN DETECTED!
-                    payout = float(opt['premium']) * float(opt['payout_multiplier'])
-                    print(f"[BLACK SWAN] Payout triggered for user {opt['user_id']}! AI failed on {win_prob*100}% confidence.")
-                    if payout > 0:
-                        # 1. Update Option status
-                        self.supabase.table('black_swan_options').update({
-                            "status": "SETTLED",
-                            "payout": payout
-                        }).eq('id', opt['id']).execute()
-                        
-                        # 2. Payout and XP to user profile
-                        try:
-                            self.supabase.rpc('increment_profile_balance', {
-                                'p_user_id': opt['user_id'],
-                                'p_amount': float(payout)
-                            }).execute()
-                            
-                            self.supabase.rpc('award_user_xp', {
-                                'p_user_id': opt['user_id'],
-                                'p_xp_amount': 200
-                            }).execute()
-                            print(f"[OPTION] Payout {payout} CR + 200 XP for user {opt['user_id']}")
-                        except Exception as e:
-                            print(f"Payout/XP error: {e}")
-                else:
-                    # AI was right, option expires worthless
-                    self.supabase.table('black_swan_options').update({
-                        "status": "EXPIRED",
-                        "result": "LOST"
-                    }).eq('id', opt['id']).execute()
+        # Index this day's signals by id: one dict lookup per option instead of a scan
+        win_probs = {str(match_id): float(prob) for match_id, prob in zip(book['match_ids'], book['probs'])}
+        if not win_probs:
+            return
+
+        # One pass over the PENDING options on these matches
+        decided = []
+        for opt in self._pending_options(list(win_probs)):
+            win_prob = win_probs.get(str(opt['match_id']))
+            if win_prob is None or win_prob < float(opt['strike_confidence']):
+                continue
+
+            # Simulation "truth" for this run: the AI was wrong with probability 1 - win_prob
+            if random.random() < win_prob:
+                # AI was right, option expires worthless
+                opt.update(status='EXPIRED', result='LOST')
+            else:
+                # BLACK SWAN DETECTED!
+                payout = float(opt['premium']) * float(opt['payout_multiplier'])
+                opt.update(status='SETTLED', result='PAYOUT', payout=payout)
+            decided.append(opt)
+
+        if not decided:
+            return
+
+        # Status, credit and XP of each chunk commit together in settle_black_swan_options
+        # (black_swan_schema.sql): a failed chunk stays PENDING and unpaid for the next run
+        settled_count = 0
+        for start in range(0, len(decided), UPSERT_CHUNK_SIZE):
+            chunk = decided[start:start + UPSERT_CHUNK_SIZE]
+            try:
+                res = self.supabase.rpc('settle_black_swan_options', {
+                    'p_results': [{k: opt.get(k) for k in ('id', 'status', 'result', 'payout')} for opt in chunk],
+                    'p_xp_per_payout': BLACK_SWAN_XP
+                }).execute()
+                settled_count += res.data or 0
+            except Exception as e:
+                print(f"Option settlement error ({len(chunk)} options left PENDING): {e}")
+
+        triggered = [opt for opt in decided if opt['status'] == 'SETTLED']
+        print(f"[BLACK SWAN] {len(triggered)} options triggered, {len(decided) - len(triggered)} expired; {settled_count} settled.")
+        if triggered:
+            print(f"[OPTION] {len(triggered)} payouts totalling {sum(opt['payout'] for opt in triggered):.2f} CR submitted.")
+
+    def _pending_options(self, match_ids):
+        """PENDING options on the given matches, keyset-paginated by id, ID_FILTER_CHUNK_SIZE matches per filter."""
+        for start in range(0, len(match_ids), ID_FILTER_CHUNK_SIZE):
+            yield from supabase_reader.stream_rows(self.supabase, 'black_swan_options', filters=[
+                ('eq', 'status', 'PENDING'),
+                ('in_', 'match_id', match_ids[start:start + ID_FILTER_CHUNK_SIZE])
+            ])
 
     def _award_achievements(self, performers, date_str):
-        """RPG Badge Logic."""
-        # 1. Alpha King (Highest ROI)
-        performers.sort(key=lambda x: x['roi'], reverse=True)
-        top = performers[0]
-        self._save_achievement(top['model_id'], 'Alpha King', f"Achieved highest ROI of {round(top['roi'], 2)}% on {date_str}")
+        """RPG Badge Logic: every rule is a vectorized filter over all performers, saved in one upsert."""
+        if not performers: return
 
-        for p in performers:
-            # 2. God Slayer (Won an underdog bet < 40% prob)
-            underdogs = [w for w in p['wins'] if w['prob'] < 0.4]
-            if underdogs:
-                self._save_achievement(p['model_id'], 'God Slayer', f"Successfully prediction an underdog victory on {date_str}")
-            
-            # 3. Iron Shield (Win streak or 5+ wins in a day)
-            if len(p['wins']) >= 5:
-                self._save_achievement(p['model_id'], 'Iron Shield', f"Maintained superior consistency with {len(p['wins'])} wins in one day")
-
-    def _save_achievement(self, model_id, a_type, desc):
-        # We only save unique achievements per model per day or per type
-        # For simplicity, we just insert. The UI can filter by latest.
-        entry = {
-            "model_id": model_id,
+        roi = np.array([p['roi'] for p in performers])
+        win_counts = np.array([len(p['wins']) for p in performers])
+        lowest_win_prob = np.array([min((w['prob'] for w in p['wins']), default=1.0) for p in performers])
+
+        achievements = []
+
+        # 1. Alpha King (Highest ROI): one crown per day, moved to the new leader on reruns
+        top = int(np.argmax(roi))
+        self._crown_alpha_king(performers[top], date_str,
+            f"Achieved highest ROI of {round(float(roi[top]), 2)}% on {date_str}")
+
+        # 2. God Slayer (Won an underdog bet < 40% prob)
+        for i in np.flatnonzero(lowest_win_prob < UNDERDOG_PROB):
+            achievements.append(self._achievement(performers[i], 'God Slayer', date_str,
+                f"Successfully prediction an underdog victory on {date_str}"))
+
+        # 3. Iron Shield (Win streak or 5+ wins in a day)
+        for i in np.flatnonzero(win_counts >= IRON_SHIELD_WINS):
+            achievements.append(self._achievement(performers[i], 'Iron Shield', date_str,
+                f"Maintained superior consistency with {int(win_counts[i])} wins in one day"))
+
+        self._save_achievements(achievements)
+
+    def _achievement(self, performer, a_type, date_str, desc):
+        return {
+            "model_id": performer['model_id'],
             "achievement_type": a_type,
+            "day": date_str,
             "description": desc
         }
-        self.supabase.table('ai_achievements').insert(entry).execute()
 
-    def _update_guild_stats(self, daily_performers):
-        """Update Guild ROIs based on aggregate model performance."""
+    def _crown_alpha_king(self, performer, date_str, desc):
+        """Upserts the day's single Alpha King row on (day) via crown_alpha_king (black_swan_schema.sql)."""
+        self.supabase.rpc('crown_alpha_king', {
+            'p_model_id': performer['model_id'],
+            'p_day': date_str,
+            'p_description': desc
+        }).execute()
+
+    def _save_achievements(self, achievements):
+        # Unique per model, type and day: reruns (every scheduler tick) refresh the same rows
+        self._bulk_upsert('ai_achievements', achievements, on_conflict='model_id,achievement_type,day')
+
+    def _update_guild_stats(self, today):
+        """Recompute every guild's 7-day ROI from its members' settled bets (one call, server-side)."""
         try:
-            guilds_res = self.supabase.table('guilds').select('*').execute()
-            guilds = guilds_res.data
-            if not guilds: return
-
-            # Calculate average ROI of all models to use as a baseline
-            baseline_roi = sum([p['roi'] for p in daily_performers]) / len(daily_performers) if daily_performers else 0
-
-            for guild in guilds:
-                # Add some variance based on risk level
-                variance = 0
-                if guild['risk_level'] == 'High Risk':
-                    variance = random.uniform(-5, 8)
-                elif guild['risk_level'] == 'Low Risk':
-                    variance = random.uniform(-1, 2)
-                else: # Medium
-                    variance = random.uniform(-2, 4)
-                
-                new_roi = baseline_roi + variance
-                
-                self.supabase.table('guilds').update({
-                    "roi_7d": round(float(new_roi), 2)
-                }).eq('id', guild['id']).execute()
-                
-            print(f"[GUILDS] Updated {len(guilds)} syndicates with dynamic ROI based on {baseline_roi}% baseline.")
+            res = self.supabase.rpc('refresh_guild_roi', {'p_today': today}).execute()
+            print(f"[GUILDS] Updated 7d ROI for {res.data or 0} syndicates from member bets.")
         except Exception as e:
             print(f"Error updating guild stats: {e}")
 
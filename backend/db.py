@@ -1,161 +1,262 @@
 import sqlite3
 import json
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 import integrity # Import Integrity Module
+import migrations # Versioned schema migrations
 
-DB_NAME = "quantgoal_core.db"
+# Resolved against this file so brain, scorekeeper and exports all share ONE database,
+# whatever working directory they were launched from.
+DB_NAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quantgoal_core.db")
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
+# Connection tuning: WAL lets readers run alongside a writer, NORMAL sync is durable enough under WAL
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000, # Negative = KiB -> ~64 MB page cache per connection
+    "temp_store": "MEMORY",
+    "mmap_size": 268435456,
+    "busy_timeout": 5000 # ms to wait on a lock instead of raising 'database is locked'
+}
+STATEMENT_CACHE_SIZE = 256 # Prepared statements kept per connection
+POOL_SIZE = 4
+
+def _connect(path):
+    # uri=True so read-only partitions can be ATTACHed as 'file:...?mode=ro' (plain paths still work)
+    conn = sqlite3.connect(path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE, uri=True)
     conn.row_factory = sqlite3.Row
+    for pragma, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma}={value}")
     return conn
 
+class ConnectionPool:
+    """
+    Reusable pool of tuned SQLite connections for one database file.
+    Each connection is lent to one caller at a time and returned afterwards,
+    so its prepared-statement cache survives across calls.
+    """
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return _connect(self.path)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commits on success, rolls back on error."""
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(path=None):
+    path = path or DB_NAME
+    with _pools_lock:
+        if path not in _pools:
+            _pools[path] = ConnectionPool(path)
+        return _pools[path]
+
+def connection(path=None):
+    """Shared entrypoint: `with db.connection() as conn: ...`"""
+    return get_pool(path).connection()
+
+def get_db_connection(path=None):
+    """Standalone (unpooled) tuned connection for ad-hoc scripts. Caller closes it."""
+    return _connect(path or DB_NAME)
+
 def init_db():
-    """Initializes the database schema."""
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # 1. Matches Table (The ground truth)
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS matches (
-        id TEXT PRIMARY KEY, -- fixture_id
-        league TEXT,
-        home_team TEXT,
-        away_team TEXT,
-        date TEXT,
-        status TEXT,
-        final_home_score INTEGER,
-        final_away_score INTEGER,
-        winner TEXT -- 'Home', 'Away', 'Draw'
-    )
-    ''')
-    
-    # 2. Predictions Table ( The AI Votes )
-    # MODIFIED: Added integrity_hash and integrity_ts
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS predictions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        match_id TEXT,
-        model_name TEXT,
-        prediction_target TEXT, -- 'Home', 'Away', 'Draw'
-        confidence INTEGER,
-        logic TEXT,
-        is_correct BOOLEAN DEFAULT NULL,
-        integrity_hash TEXT,
-        integrity_ts INTEGER,
-        FOREIGN KEY (match_id) REFERENCES matches (id)
-    )
-    ''')
-
-    # 3. Consensus/Financial Table (The System's Call)
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS consensus_signals (
-        match_id TEXT PRIMARY KEY,
-        signal_type TEXT,
-        ev_percent REAL,
-        kelly_stake REAL,
-        market_odds_home REAL,
-        market_odds_away REAL,
-        market_odds_draw REAL,
-        FOREIGN KEY (match_id) REFERENCES matches (id)
-    )
-    ''')
-
-    # 4. Performance Ledger (The Leaderboard Source)
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS model_performance (
-        model_name TEXT,
-        date TEXT,
-        daily_pnl REAL,
-        total_pnl REAL,
-        strike_rate REAL,
-        PRIMARY KEY (model_name, date)
-    )
-    ''')
-
-    conn.commit()
-    conn.close()
+    """Initializes / upgrades the database schema via versioned migrations."""
+    with connection() as conn:
+        migrations.migrate(conn)
     print(f"Database {DB_NAME} initialized successfully.")
 
+CONSENSUS_MODEL_NAME = "QuantGoal v2.0 (Consensus)"
+CONSENSUS_LOGIC = "ACW Weighted Algorithm + Kelly Criterion (System Pick)"
+
 def save_match_and_predictions(match_data, models_data, consensus_data, odds_data):
     """Saves a fully analyzed match cycle to the DB."""
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    m = match_data
-    match_id = str(m['fixture_id'])
-    
-    # Upsert Match
-    c.execute('''
-    INSERT OR REPLACE INTO matches (id, league, home_team, away_team, date, status)
-    VALUES (?, ?, ?, ?, ?, ?)
-    ''', (match_id, m['league'], m['home'], m['away'], m.get('date'), m.get('status')))
-    
-    # Save Model Predictions WITH PROOF OF INTEGRITY
-    for model in models_data:
-        # Determine strict target
-        raw = (model.get('winner', '') + " " + model.get('prediction', '')).lower()
-        if 'home' in raw: target = 'Home'
-        elif 'away' in raw: target = 'Away'
-        else: target = 'Draw'
-        
-        # GENERATE HASH
-        sig = integrity.generate_prediction_signature(match_id, model['model'], target)
-        
-        # Save hash along with data
-        c.execute('''
-        INSERT INTO predictions (match_id, model_name, prediction_target, confidence, logic, integrity_hash, integrity_ts)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            match_id, 
-            model['model'], 
-            target, 
-            model['confidence'], 
-            model['logic'],
-            sig['hash'],
-            sig['timestamp']
+    return save_slate([(match_data, models_data, consensus_data, odds_data)])
+
+def save_slate(cycles):
+    """
+    Bulk-persists a whole slate in ONE transaction.
+    `cycles` is an iterable of (match_data, models_data, consensus_data, odds_data) tuples,
+    the same shape save_match_and_predictions takes for a single fixture.
+    Returns insert counts per table.
+    """
+    match_rows = []
+    prediction_rows = []
+    signal_rows = []
+    timestamp = int(time.time()) # One signing time per cycle
+    batch = None
+
+    for match_data, models_data, consensus_data, odds_data in cycles:
+        m = match_data
+        match_id = str(m['fixture_id'])
+        match_rows.append((match_id, m['league'], m['home'], m['away'], m.get('date'), m.get('status')))
+
+        # Model Predictions (signed together below)
+        for model in models_data:
+            prediction_rows.append((
+                match_id, model['model'], _prediction_target(model), model['confidence'], model['logic']
+            ))
+
+        # Consensus ITSELF as a generic "Model" so "QuantGoal v2.0" appears in the ranking list
+        prediction_rows.append((
+            match_id, CONSENSUS_MODEL_NAME, consensus_data.get('target', 'Draw'),
+            consensus_data.get('confidence', 0), CONSENSUS_LOGIC
         ))
-        
-    # --- NEW: Save Consensus ITSELF as a generic "Model" for the Leaderboard ---
-    # This ensures "QuantGoal v2.0" appears in the ranking list.
-    cons_target = consensus_data.get('target', 'Draw')
-    cons_model_name = "QuantGoal v2.0 (Consensus)"
-    
-    # Generate Hash for Consensus
-    cons_sig = integrity.generate_prediction_signature(match_id, cons_model_name, cons_target)
-    
-    c.execute('''
-    INSERT INTO predictions (match_id, model_name, prediction_target, confidence, logic, integrity_hash, integrity_ts)
-    VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        match_id, 
-        cons_model_name, 
-        cons_target, 
-        consensus_data.get('confidence', 0), 
-        "ACW Weighted Algorithm + Kelly Criterion (System Pick)",
-        cons_sig['hash'],
-        cons_sig['timestamp']
-    ))
-    # --------------------------------------------------------------------------
-        
-    # Save Consensus Financials
-    c.execute('''
-    INSERT OR REPLACE INTO consensus_signals 
-    (match_id, signal_type, ev_percent, kelly_stake, market_odds_home, market_odds_away, market_odds_draw)
-    VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        match_id, 
-        consensus_data['signal'], 
-        consensus_data['edge_percent'], 
-        consensus_data['kelly_stake'],
-        odds_data.get('Home'),
-        odds_data.get('Away'),
-        odds_data.get('Draw')
-    ))
-    
-    conn.commit()
-    conn.close()
+
+        signal_rows.append((
+            match_id,
+            consensus_data['signal'],
+            consensus_data['edge_percent'],
+            consensus_data['kelly_stake'],
+            odds_data.get('Home'),
+            odds_data.get('Away'),
+            odds_data.get('Draw')
+        ))
+
+    # PROOF OF INTEGRITY: the whole cycle is one Merkle tree, only its root is stored
+    if prediction_rows:
+        batch = integrity.sign_prediction_batch([row[:3] for row in prediction_rows], timestamp)
+
+    with connection() as conn:
+        if batch:
+            batch_id = conn.execute(
+                "INSERT INTO integrity_batches (merkle_root, leaf_count, signed_ts) VALUES (?, ?, ?)",
+                (batch['root'], batch['leaf_count'], batch['timestamp'])
+            ).lastrowid
+            prediction_rows = [
+                row + (sig['hash'], sig['timestamp'], batch_id, sig['leaf_index'], sig['proof'])
+                for row, sig in zip(prediction_rows, batch['signatures'])
+            ]
+
+        conn.executemany('''
+        INSERT OR REPLACE INTO matches (id, league, home_team, away_team, date, status)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', match_rows)
+
+        conn.executemany('''
+        INSERT INTO predictions (match_id, model_name, prediction_target, confidence, logic,
+                                 integrity_hash, integrity_ts, integrity_batch_id, merkle_leaf_index, merkle_proof)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', prediction_rows)
+
+        conn.executemany('''
+        INSERT OR REPLACE INTO consensus_signals 
+        (match_id, signal_type, ev_percent, kelly_stake, market_odds_home, market_odds_away, market_odds_draw)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', signal_rows)
+
+    return {
+        "matches": len(match_rows),
+        "predictions": len(prediction_rows),
+        "consensus_signals": len(signal_rows),
+        "merkle_root": batch['root'] if batch else None
+    }
+
+def _prediction_target(model):
+    """Determine strict target ('Home' / 'Away' / 'Draw') from a model's free-text output."""
+    raw = (model.get('winner', '') + " " + model.get('prediction', '')).lower()
+    if 'home' in raw: return 'Home'
+    if 'away' in raw: return 'Away'
+    return 'Draw'
+
+def verify_prediction(prediction_id, path=None):
+    """
+    Single-record check: recomputes the leaf and walks its proof up to the cycle root (O(log n)).
+    The record is looked up in the hot database and every archived month (partitions.py);
+    the cycle roots always stay in the hot database.
+    """
+    import partitions # Imports db itself
+    rows = partitions.PartitionRouter(path).query('''
+        SELECT p.match_id, p.model_name, p.prediction_target, p.integrity_ts, p.integrity_hash,
+               p.integrity_batch_id, p.merkle_proof, b.merkle_root
+        FROM {db}.predictions p
+        LEFT JOIN main.integrity_batches b ON b.id = p.integrity_batch_id
+        WHERE p.id = ?
+        ''', (prediction_id,))
+    if not rows:
+        return False
+    row = rows[0]
+
+    leaf = integrity.generate_prediction_signature(
+        row['match_id'], row['model_name'], row['prediction_target'], row['integrity_ts']
+    )['hash']
+    if leaf != row['integrity_hash']:
+        return False
+    if row['integrity_batch_id'] is None:
+        return True # Signed before batching: the record hash is all there is
+    return row['merkle_root'] is not None and integrity.verify_inclusion(leaf, row['merkle_proof'] or "", row['merkle_root'])
+
+def verify_all_predictions(path=None, include_archives=None):
+    """
+    Bulk verifier over the whole predictions table in one streaming pass. Returns a report dict.
+    Archived months of the same database (partitions.py) are merged into the same pass
+    unless include_archives is False.
+    """
+    import partitions # Imports db itself
+    if include_archives is None:
+        include_archives = True
+
+    conn = get_db_connection(path)
+    try:
+        roots = conn.cursor()
+        def get_batch(batch_id):
+            row = roots.execute(
+                "SELECT merkle_root, leaf_count FROM integrity_batches WHERE id = ?", (batch_id,)
+            ).fetchone()
+            return (row[0], row[1]) if row else None
+
+        sql = '''
+        SELECT id, integrity_batch_id, merkle_leaf_index, match_id, model_name, prediction_target,
+               integrity_ts, integrity_hash, merkle_proof
+        FROM predictions
+        ORDER BY integrity_batch_id, merkle_leaf_index
+        '''
+        if not include_archives:
+            return integrity.verify_prediction_batches(conn.execute(sql), get_batch)
+
+        # SQLite sorts NULL (pre-batching rows) first; the merge key must agree
+        order = lambda row: (row[1] is not None, row[1] or 0, row[2] or 0)
+        rows = partitions.PartitionRouter(path).stream_sorted(sql, key=order)
+        return integrity.verify_prediction_batches(rows, get_batch)
+    finally:
+        conn.close()
 
 if __name__ == "__main__":
     init_db()
@@ -1,8 +1,39 @@
+"""
+Decision Ledger: append-only record of every model decision and settlement.
+
+Storage
+- The source of truth is a log of JSONL segments under backend/ledger/. Logging an entry
+  is an O(1) buffered append; nothing already written is ever rewritten.
+- A segment is rotated once it passes SEGMENT_MAX_BYTES or SEGMENT_MAX_AGE seconds.
+- public/decision_ledger.json is only a compacted snapshot (last SNAPSHOT_ENTRIES entries)
+  for the frontend, re-exported atomically every SNAPSHOT_INTERVAL seconds and on exit.
+  Full history stays in the segments.
+
+Index
+- backend/ledger/index.db is a SQLite sidecar mapping every entry to its (segment, offset)
+  and keyed by model, match, status and timestamp. It is derived data: it catches up by
+  reading only the bytes appended since it last ran, and can be deleted and rebuilt.
+- A SETTLEMENT entry moves the PENDING predictions of the same (model, match) to its
+  result, so settling is O(matches settled) and query() always returns current status.
+"""
+import atexit
 import json
 import os
+import time
 from datetime import datetime
+import db
+import json_export
 
 DECISION_LEDGER_PATH = os.path.join(os.path.dirname(__file__), '../public/decision_ledger.json')
+LEDGER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ledger')
+INDEX_NAME = 'index.db'
+
+SEGMENT_MAX_BYTES = 4 * 1024 * 1024
+SEGMENT_MAX_AGE = 24 * 3600 # seconds
+FLUSH_EVERY = 32 # entries buffered before hitting the disk
+FLUSH_INTERVAL = 5 # seconds; older buffered entries are flushed on the next append
+SNAPSHOT_ENTRIES = 1000
+SNAPSHOT_INTERVAL = 60 # seconds
 
 def log_decision(model_name, match, selection, odds, confidence, rationale):
     """
@@ -24,6 +55,7 @@ def log_decision(model_name, match, selection, odds, confidence, rationale):
 def log_settlement(model_name, match, result, pnl):
     """
     Log the settlement of a prediction to the ledger.
+    Pending PREDICTION entries for the same model and match take `result` as their status.
     """
     entry = {
         "timestamp": datetime.now().isoformat(),
@@ -35,21 +67,308 @@ def log_settlement(model_name, match, result, pnl):
     }
     _write_to_ledger(entry)
 
-def _write_to_ledger(entry):
-    ledger = []
-    if os.path.exists(DECISION_LEDGER_PATH):
+class SegmentLog:
+    """
+    Append-only JSONL log split into time-ordered segment files.
+
+    Each flush is one write() of whole lines to a file opened in append mode, followed by
+    fsync, so a crash can at worst lose the unflushed buffer or leave one torn last line,
+    which readers skip.
+    """
+
+    def __init__(self, directory, max_bytes=SEGMENT_MAX_BYTES, max_age=SEGMENT_MAX_AGE,
+                 flush_every=FLUSH_EVERY, flush_interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._oldest_buffered = None
+
+    def segments(self):
+        """Segment paths, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith('segment_') and n.endswith('.jsonl'))
+        return [os.path.join(self.directory, n) for n in names]
+
+    def append(self, entry):
+        self.extend([entry])
+
+    def extend(self, entries):
+        self._buffer.extend(json.dumps(entry, ensure_ascii=False) for entry in entries)
+        now = time.time()
+        if self._oldest_buffered is None:
+            self._oldest_buffered = now
+        if len(self._buffer) >= self.flush_every or now - self._oldest_buffered >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        path = self._active_segment()
+        data = ('\n'.join(self._buffer) + '\n').encode('utf-8')
+        if _ends_torn(path):
+            data = b'\n' + data # Never glue new entries onto a torn line
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
         try:
-            with open(DECISION_LEDGER_PATH, 'r', encoding='utf-8') as f:
-                ledger = json.load(f)
-        except:
-            ledger = []
-    
-    # Append new entry
-    ledger.append(entry)
-    
-    # Keep last 1000 entries for performance
-    if len(ledger) > 1000:
-        ledger = ledger[-1000:]
-        
-    with open(DECISION_LEDGER_PATH, 'w', encoding='utf-8') as f:
-        json.dump(ledger, f, indent=2, ensure_ascii=False)
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._buffer = []
+        self._oldest_buffered = None
+
+    def read(self, segments=None):
+        """Yields every entry in append order (flushed entries only)."""
+        for path in self.segments() if segments is None else segments:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue # Torn last line from a crash mid-write
+
+    def _active_segment(self):
+        segments = self.segments()
+        if segments:
+            path = segments[-1]
+            started = datetime.strptime(os.path.basename(path)[8:23], '%Y%m%dT%H%M%S').timestamp()
+            if os.path.getsize(path) < self.max_bytes and time.time() - started < self.max_age:
+                return path
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"segment_{datetime.now().strftime('%Y%m%dT%H%M%S')}_{len(segments):06d}.jsonl"
+        return os.path.join(self.directory, name)
+
+def _ends_torn(path):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b'\n'
+
+class LedgerIndex:
+    """
+    Sidecar index over a SegmentLog.
+    Rows point at (segment, offset, length) so matching entries are read back with one
+    seek each; `status` holds the current status after settlements are applied.
+    """
+
+    def __init__(self, log, path=None):
+        self.log = log
+        self.path = path or os.path.join(log.directory, INDEX_NAME)
+        self._conn = None
+
+    def connection(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = db.get_db_connection(self.path)
+            self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY,
+                segment TEXT,
+                offset INTEGER,
+                length INTEGER,
+                type TEXT,
+                model TEXT,
+                match TEXT,
+                status TEXT,
+                ts TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_match_status ON entries (match, status);
+            CREATE INDEX IF NOT EXISTS idx_entries_model_ts ON entries (model, ts);
+            CREATE INDEX IF NOT EXISTS idx_entries_status_ts ON entries (status, ts);
+            CREATE TABLE IF NOT EXISTS segments (
+                name TEXT PRIMARY KEY,
+                indexed_bytes INTEGER
+            );
+            ''')
+        return self._conn
+
+    def catch_up(self):
+        """Indexes whatever was appended since the last call (by any process). Returns entries added."""
+        conn = self.connection()
+        done = dict(conn.execute("SELECT name, indexed_bytes FROM segments").fetchall())
+        added = 0
+        for path in self.log.segments():
+            name = os.path.basename(path)
+            start = done.get(name, 0)
+            if os.path.getsize(path) <= start:
+                continue
+            with open(path, 'rb') as f:
+                f.seek(start)
+                data = f.read()
+            end = data.rfind(b'\n') + 1 # Only whole lines; a torn tail waits for its newline
+            if not end:
+                continue
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have indexed this range since `done` was read: re-read
+                # under the write lock and only index what is still new
+                row = conn.execute("SELECT indexed_bytes FROM segments WHERE name = ?", (name,)).fetchone()
+                indexed = row[0] if row else 0
+                if indexed >= start + end:
+                    conn.rollback()
+                    continue
+                if indexed > start:
+                    data, end, start = data[indexed - start:], end - (indexed - start), indexed
+                offset = start
+                for line in data[:end].split(b'\n')[:-1]:
+                    added += self._index_line(conn, name, offset, line)
+                    offset += len(line) + 1
+                conn.execute(
+                    "INSERT OR REPLACE INTO segments (name, indexed_bytes) VALUES (?, ?)", (name, start + end)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return added
+
+    def _index_line(self, conn, segment, offset, line):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return 0 # Torn line left behind by a crash
+        conn.execute(
+            "INSERT INTO entries (segment, offset, length, type, model, match, status, ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (segment, offset, len(line), entry.get('type'), entry.get('model'), entry.get('match'),
+             entry.get('status'), entry.get('timestamp'))
+        )
+        if entry.get('type') == 'SETTLEMENT':
+            conn.execute('''
+            UPDATE entries SET status = ?
+            WHERE match = ? AND model = ? AND status = 'PENDING' AND type = 'PREDICTION' AND ts <= ?
+            ''', (str(entry.get('result')).upper(), entry.get('match'), entry.get('model'), entry.get('timestamp')))
+        return 1
+
+    def query(self, model=None, match=None, status=None, entry_type=None, since=None, until=None,
+              limit=None, newest_first=False):
+        """Matching entries with their current status and ledger `id`; `since` / `until` are ISO timestamps."""
+        clauses, params = [], []
+        for column, value in (("model", model), ("match", match), ("status", status), ("type", entry_type)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts <= ?")
+            params.append(until)
+
+        sql = "SELECT id, segment, offset, length, status FROM entries"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id DESC" if newest_first else " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return self._load(self.connection().execute(sql, params).fetchall())
+
+    def _load(self, rows):
+        entries, handles = [], {}
+        try:
+            for row in rows:
+                f = handles.get(row['segment'])
+                if f is None:
+                    f = handles[row['segment']] = open(os.path.join(self.log.directory, row['segment']), 'rb')
+                f.seek(row['offset'])
+                entry = json.loads(f.read(row['length']))
+                entry['id'] = row['id']
+                if row['status'] is not None:
+                    entry['status'] = row['status']
+                entries.append(entry)
+        finally:
+            for f in handles.values():
+                f.close()
+        return entries
+
+_log = SegmentLog(LEDGER_DIR)
+_index = LedgerIndex(_log)
+_last_snapshot = 0.0
+_snapshot_stale = False
+_legacy_checked = False
+
+def _write_to_ledger(entry):
+    global _snapshot_stale, _legacy_checked
+    if not _legacy_checked:
+        _legacy_checked = True
+        if not _log.segments():
+            _import_legacy_snapshot()
+    _log.append(entry)
+    _snapshot_stale = True
+    if time.time() - _last_snapshot >= SNAPSHOT_INTERVAL:
+        compact()
+
+def flush():
+    _log.flush()
+
+def read_ledger():
+    """Full ledger history, oldest first (as logged, without settlement status applied)."""
+    _log.flush()
+    return _log.read()
+
+def query(model=None, match=None, status=None, entry_type=None, since=None, until=None, limit=None):
+    """
+    Indexed lookup, oldest first, e.g.
+        query(match="Arsenal vs Chelsea", status="PENDING", entry_type="PREDICTION")
+        query(model="DeepSeek V3", since="2025-12-01", until="2025-12-31T23:59:59")
+    """
+    _sync()
+    return _index.query(model, match, status, entry_type, since, until, limit)
+
+def pending_decisions(match):
+    """All still-open PREDICTION entries for a match."""
+    return query(match=match, status="PENDING", entry_type="PREDICTION")
+
+def model_decisions(model_name, since=None, until=None):
+    """A model's PREDICTION entries in a time range."""
+    return query(model=model_name, entry_type="PREDICTION", since=since, until=until)
+
+def settle_match(match, results):
+    """
+    Settles every pending decision for one match.
+    `results` is {model_name: (result, pnl)}; only models with a pending entry are logged.
+    Returns the number of settlement entries written.
+    """
+    settled = 0
+    for model_name in dict.fromkeys(e['model'] for e in pending_decisions(match)):
+        if model_name in results:
+            result, pnl = results[model_name]
+            log_settlement(model_name, match, result, pnl)
+            settled += 1
+    return settled
+
+def _sync():
+    _log.flush()
+    _index.catch_up()
+
+def compact():
+    """Flushes the log and re-exports the frontend snapshot (last SNAPSHOT_ENTRIES entries, current status)."""
+    global _last_snapshot, _snapshot_stale
+    _sync()
+    latest = _index.query(limit=SNAPSHOT_ENTRIES, newest_first=True)
+    json_export.write_json(DECISION_LEDGER_PATH, latest[::-1])
+    _last_snapshot = time.time()
+    _snapshot_stale = False
+
+def _import_legacy_snapshot():
+    """First run on an existing install: seed the log with the old whole-file ledger."""
+    if not os.path.exists(DECISION_LEDGER_PATH):
+        return
+    try:
+        with open(DECISION_LEDGER_PATH, 'r', encoding='utf-8') as f:
+            legacy = json.load(f)
+    except (ValueError, OSError):
+        return
+    if isinstance(legacy, list) and legacy:
+        _log.extend(legacy)
+        _log.flush()
+
+@atexit.register
+def _close():
+    if _snapshot_stale:
+        compact()
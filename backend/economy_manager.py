@@ -1,6 +1,22 @@
+"""
+Arena Coin economy.
+
+Balances and transactions live in quantgoal_core.db (economy_users / economy_transactions /
+economy_stats, see migrations.py). Every grant or purchase is one short write transaction,
+so concurrent writers serialize on SQLite's lock instead of overwriting each other.
+
+public/economy_data.json is an exported snapshot for the frontend (balances plus the most
+recent SNAPSHOT_TRANSACTIONS per user), refreshed at most every SNAPSHOT_INTERVAL seconds
+and on exit.
+"""
+import atexit
 import json
 import os
+import time
 from datetime import datetime
+import db
+import migrations
+import json_export
 
 ECONOMY_DATA_PATH = os.path.join(os.path.dirname(__file__), '../public/economy_data.json')
 
@@ -12,50 +28,156 @@ PRICING_MODEL = {
 
 INITIAL_GRANT = 10000
 
+SNAPSHOT_TRANSACTIONS = 50 # Per user, newest kept in the JSON export
+SNAPSHOT_INTERVAL = 60 # seconds
+
+_store_ready = False
+_last_snapshot = 0.0
+_snapshot_stale = False
+
 def get_economy_state():
-    if not os.path.exists(ECONOMY_DATA_PATH):
-        return {"users": {}, "global_stats": {"total_coins_issued": 0, "total_burn": 0}}
-    with open(ECONOMY_DATA_PATH, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    """Whole-economy view in the legacy JSON shape (recent transactions only)."""
+    _ensure_store()
+    with db.connection() as conn:
+        users = {
+            row['user_id']: {"balance": row['balance'], "transactions": []}
+            for row in conn.execute("SELECT user_id, balance FROM economy_users ORDER BY user_id")
+        }
+        recent = conn.execute('''
+            SELECT * FROM (
+                SELECT t.*, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id DESC) AS rn
+                FROM economy_transactions t
+            )
+            WHERE rn <= ?
+            ORDER BY user_id, id
+        ''', (SNAPSHOT_TRANSACTIONS,)).fetchall()
+        stats = dict(conn.execute("SELECT key, value FROM economy_stats").fetchall())
 
-def initialize_user_economy(user_id):
-    data = get_economy_state()
-    if user_id not in data['users']:
-        data['users'][user_id] = {
-            "balance": INITIAL_GRANT,
-            "transactions": [{
-                "timestamp": datetime.now().isoformat(),
-                "type": "GRANT",
-                "amount": INITIAL_GRANT,
-                "description": "Initial Central Bank Grant"
-            }]
+    for row in recent:
+        users[row['user_id']]['transactions'].append(_transaction_dict(row))
+    return {
+        "users": users,
+        "global_stats": {
+            "total_coins_issued": stats.get('total_coins_issued', 0),
+            "total_burn": stats.get('total_burn', 0)
         }
-        data['global_stats']['total_coins_issued'] += INITIAL_GRANT
-        _save_economy(data)
-    return data['users'][user_id]
+    }
+
+def get_user_economy(user_id, limit=SNAPSHOT_TRANSACTIONS):
+    """One user's balance and most recent transactions, or None if unknown."""
+    _ensure_store()
+    with db.connection() as conn:
+        row = conn.execute("SELECT balance FROM economy_users WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        transactions = conn.execute(
+            "SELECT * FROM economy_transactions WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit)
+        ).fetchall()
+    return {"balance": row['balance'], "transactions": [_transaction_dict(t) for t in reversed(transactions)]}
+
+def initialize_user_economy(user_id):
+    _ensure_store()
+    with db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        _grant_if_new(conn, user_id)
+    _mark_changed()
+    return get_user_economy(user_id)
 
 def purchase_coins(user_id, package_type):
     if package_type not in PRICING_MODEL:
         return False
-    
-    data = get_economy_state()
+
+    _ensure_store()
     package = PRICING_MODEL[package_type]
-    
-    if user_id not in data['users']:
-        initialize_user_economy(user_id)
-        
-    data['users'][user_id]['balance'] += package['coins']
-    data['users'][user_id]['transactions'].append({
-        "timestamp": datetime.now().isoformat(),
-        "type": "PURCHASE",
-        "package": package_type,
-        "amount": package['coins'],
-        "price_usd": package['price_usd']
-    })
-    data['global_stats']['total_coins_issued'] += package['coins']
-    _save_economy(data)
+
+    # Grant (for new users), credit, ledger row and global counter commit together or not at all
+    with db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        _grant_if_new(conn, user_id)
+        conn.execute(
+            "UPDATE economy_users SET balance = balance + ? WHERE user_id = ?", (package['coins'], user_id)
+        )
+        _record(conn, user_id, "PURCHASE", package['coins'], package=package_type, price_usd=package['price_usd'])
+    _mark_changed()
     return True
 
-def _save_economy(data):
-    with open(ECONOMY_DATA_PATH, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def export_snapshot():
+    """Writes public/economy_data.json atomically from the store."""
+    global _last_snapshot, _snapshot_stale
+    json_export.write_json(ECONOMY_DATA_PATH, get_economy_state())
+    _last_snapshot = time.time()
+    _snapshot_stale = False
+
+def _grant_if_new(conn, user_id):
+    now = datetime.now().isoformat()
+    cur = conn.execute(
+        "INSERT OR IGNORE INTO economy_users (user_id, balance, created_at) VALUES (?, ?, ?)",
+        (user_id, INITIAL_GRANT, now)
+    )
+    if cur.rowcount:
+        _record(conn, user_id, "GRANT", INITIAL_GRANT, description="Initial Central Bank Grant", timestamp=now)
+
+def _record(conn, user_id, tx_type, amount, package=None, price_usd=None, description=None, timestamp=None):
+    conn.execute('''
+        INSERT INTO economy_transactions (user_id, timestamp, type, amount, package, price_usd, description)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, timestamp or datetime.now().isoformat(), tx_type, amount, package, price_usd, description))
+    if amount > 0:
+        conn.execute("UPDATE economy_stats SET value = value + ? WHERE key = 'total_coins_issued'", (amount,))
+
+def _transaction_dict(row):
+    tx = {"timestamp": row['timestamp'], "type": row['type']}
+    if row['package'] is not None:
+        tx["package"] = row['package']
+    tx["amount"] = row['amount']
+    if row['price_usd'] is not None:
+        tx["price_usd"] = row['price_usd']
+    if row['description'] is not None:
+        tx["description"] = row['description']
+    return tx
+
+def _mark_changed():
+    global _snapshot_stale
+    _snapshot_stale = True
+    if time.time() - _last_snapshot >= SNAPSHOT_INTERVAL:
+        export_snapshot()
+
+def _ensure_store():
+    """Applies pending migrations and, on first run, imports the legacy economy_data.json."""
+    global _store_ready
+    if _store_ready:
+        return
+    with db.connection() as conn:
+        migrations.migrate(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        empty = conn.execute("SELECT COUNT(*) FROM economy_users").fetchone()[0] == 0
+        if empty and os.path.exists(ECONOMY_DATA_PATH):
+            _import_legacy(conn)
+    _store_ready = True
+
+def _import_legacy(conn):
+    try:
+        with open(ECONOMY_DATA_PATH, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (ValueError, OSError):
+        return
+    for user_id, user in data.get('users', {}).items():
+        conn.execute("INSERT INTO economy_users (user_id, balance) VALUES (?, ?)", (user_id, user.get('balance', 0)))
+        conn.executemany('''
+            INSERT INTO economy_transactions (user_id, timestamp, type, amount, package, price_usd, description)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (user_id, tx.get('timestamp'), tx.get('type'), tx.get('amount', 0),
+             tx.get('package'), tx.get('price_usd'), tx.get('description'))
+            for tx in user.get('transactions', [])
+        ])
+    stats = data.get('global_stats', {})
+    conn.executemany(
+        "UPDATE economy_stats SET value = ? WHERE key = ?",
+        [(stats.get('total_coins_issued', 0), 'total_coins_issued'), (stats.get('total_burn', 0), 'total_burn')]
+    )
+
+@atexit.register
+def _close():
+    if _snapshot_stale:
+        export_snapshot()
@@ -1,4 +1,3 @@
-import json
 import os
 import requests
 import random
@@ -10,6 +9,7 @@ import time
 load_dotenv()
 
 from brain import call_real_model_api
+import json_export
 
 def force_generate_live_debate():
     print("--- 🔴 LIVE ACTION: INITIATING REAL AI DEBATE ---")
@@ -36,74 +36,69 @@ def force_generate_live_debate():
         }
     ]
     
-    generated_matches = []
-    
     personas_order = ["DeepSeek", "Gemini", "Qwen", "Claude", "Grok", "ChatGPT"]
-    
-    for fixture in real_fixtures:
-        print(f"\n⚽ Analyzing: {fixture['home']} vs {fixture['away']} ...")
+
+    # OUTPUT: each match is streamed to the snapshot as soon as its debate is done
+    with json_export.JsonArrayWriter(json_export.public_path('matches_data.json'), pretty=True) as out:
+        for fixture in real_fixtures:
+            print(f"\n⚽ Analyzing: {fixture['home']} vs {fixture['away']} ...")
         
-        match_info = {
-            "home_team": fixture['home'],
-            "away_team": fixture['away'],
-            "league": fixture['league'],
-            "date": datetime.now().isoformat()
-        }
+            match_info = {
+                "home_team": fixture['home'],
+                "away_team": fixture['away'],
+                "league": fixture['league'],
+                "date": datetime.now().isoformat()
+            }
         
-        script = []
+            script = []
         
-        # Determine a rough 'consensus' to guide the debate slightly (or let chaos reign)
-        # We'll just let them fight.
+            # Determine a rough 'consensus' to guide the debate slightly (or let chaos reign)
+            # We'll just let them fight.
         
-        for model_name in personas_order:
-            print(f"   >>> Polling {model_name}...")
+            for model_name in personas_order:
+                print(f"   >>> Polling {model_name}...")
             
-            # Context injection
-            pred_ctx = "Home Win" if model_name in ["DeepSeek", "ChatGPT", "Qwen"] else "Away Win"
-            if model_name == "Grok": pred_ctx = "Draw" # Grok being annoying
+                # Context injection
+                pred_ctx = "Home Win" if model_name in ["DeepSeek", "ChatGPT", "Qwen"] else "Away Win"
+                if model_name == "Grok": pred_ctx = "Draw" # Grok being annoying
             
-            try:
-                # Add randomized memory to make it feel 'alive'
-                response_text = call_real_model_api(model_name, match_info, pred_ctx)
+                try:
+                    # Add randomized memory to make it feel 'alive'
+                    response_text = call_real_model_api(model_name, match_info, pred_ctx)
                 
-                # Cleanup
-                clean_logic = response_text if response_text else f"[{model_name}] Analyzing live data streams..."
-                if "] " in clean_logic: clean_logic = clean_logic.split("] ", 1)[-1]
+                    # Cleanup
+                    clean_logic = response_text if response_text else f"[{model_name}] Analyzing live data streams..."
+                    if "] " in clean_logic: clean_logic = clean_logic.split("] ", 1)[-1]
                 
-                entry = {
-                    "model": f"{model_name} {'V3' if 'DeepSeek' in model_name else ''}",
-                    "confidence": random.randint(60, 95),
-                    "logic": clean_logic
-                }
-                script.append(entry)
-                time.sleep(1) # Mild delay to prevent rate limits
+                    entry = {
+                        "model": f"{model_name} {'V3' if 'DeepSeek' in model_name else ''}",
+                        "confidence": random.randint(60, 95),
+                        "logic": clean_logic
+                    }
+                    script.append(entry)
+                    time.sleep(1) # Mild delay to prevent rate limits
                 
-            except Exception as e:
-                print(f"      [X] Error: {e}")
+                except Exception as e:
+                    print(f"      [X] Error: {e}")
 
-        # Construct Match Object
-        new_match = {
-            "id": f"match_real_{fixture['home'][:3]}_{fixture['away'][:3]}",
-            "match_info": match_info,
-            "consensus": {
-                "signal": "AI LIVE DEBATE",
-                "target": fixture['home'],
-                "confidence": random.randint(75, 88), 
-                "market_odds": round(random.uniform(1.8, 3.2), 2), 
-                "ai_probability": 0.62,
-                "edge_percent": round(random.uniform(5, 12), 1),
-                "kelly_stake": "4%"
-            },
-            "models": script
-        }
-        generated_matches.append(new_match)
+            # Construct Match Object
+            new_match = {
+                "id": f"match_real_{fixture['home'][:3]}_{fixture['away'][:3]}",
+                "match_info": match_info,
+                "consensus": {
+                    "signal": "AI LIVE DEBATE",
+                    "target": fixture['home'],
+                    "confidence": random.randint(75, 88), 
+                    "market_odds": round(random.uniform(1.8, 3.2), 2), 
+                    "ai_probability": 0.62,
+                    "edge_percent": round(random.uniform(5, 12), 1),
+                    "kelly_stake": "4%"
+                },
+                "models": script
+            }
+            out.write(new_match)
 
-    # OUTPUT
-    output_path = '../public/matches_data.json'
-    with open(output_path, 'w') as f:
-        json.dump(generated_matches, f, indent=2)
-        
-    print(f"\n--- 🟢 SUCCESS: Generated {len(generated_matches)} REAL matches ---")
+    print(f"\n--- 🟢 SUCCESS: Generated {out.count} REAL matches ---")
 
 if __name__ == "__main__":
     force_generate_live_debate()
@@ -0,0 +1,94 @@
+import numpy as np
+
+class LeagueMonteCarloSimulator:
+    """
+    LEAGUE ENGINE UPGRADE: Vectorized Monte Carlo Simulation
+    Replaces the single random.random() realisation per signal with thousands of
+    seeded outcome paths, simulated for every model and signal in one array pass.
+
+    For each model it reports:
+    1. Expected PnL and PnL distribution (quantiles)
+    2. Max drawdown quantiles across paths
+    3. Probability of ruin (intraday drawdown reaching ruin_drawdown of the starting balance)
+    4. The day's side-wallet PnL (SIDE_WALLETS), drawn from the same seeded generator so a
+       rerun for the same seed reproduces the whole day
+    """
+
+    PNL_QUANTILES = (0.05, 0.25, 0.50, 0.75, 0.95)
+    DRAWDOWN_QUANTILES = (0.50, 0.95, 0.99)
+    SIDE_WALLETS = {"challenge_pnl": (-50.0, 80.0), "high_yield_pnl": (-100.0, 150.0)} # Uniform (low, high)
+
+    def __init__(self, n_paths=5000, stake=100.0, ruin_drawdown=0.10, seed=None, chunk_size=1000):
+        self.n_paths = int(n_paths)
+        self.stake = float(stake)
+        self.ruin_drawdown = float(ruin_drawdown)
+        self.seed = seed
+        self.chunk_size = int(chunk_size)
+
+    def simulate(self, model_ids, win_probs, odds, starting_balances):
+        """
+        Simulates n_paths outcome paths for every (model, signal) pair.
+
+        model_ids: list of M model ids
+        win_probs / odds: arrays of shape (S,) shared by every model, or (M, S) per model
+        starting_balances: array of shape (M,)
+
+        Returns {model_id: summary}. Path 0 is kept as the 'realised' day so callers
+        still get a concrete win/loss list for achievements and options.
+        """
+        n_models = len(model_ids)
+        probs = np.broadcast_to(np.asarray(win_probs, dtype=float), (n_models, np.shape(win_probs)[-1]))
+        prices = np.broadcast_to(np.asarray(odds, dtype=float), probs.shape)
+        balances = np.asarray(starting_balances, dtype=float).reshape(n_models, 1, 1)
+        n_signals = probs.shape[1]
+
+        rng = np.random.default_rng(self.seed)
+        side_pnl = {name: rng.uniform(low, high, size=n_models) for name, (low, high) in self.SIDE_WALLETS.items()}
+        ruin_level = balances[:, :, 0] * (1 - self.ruin_drawdown)
+
+        if n_signals == 0:
+            final_pnl = np.zeros((n_models, self.n_paths))
+            max_drawdown = np.zeros((n_models, self.n_paths))
+            ruined = np.zeros((n_models, self.n_paths), dtype=bool)
+            realised = np.zeros((n_models, 0), dtype=bool)
+        else:
+            win_pnl = (self.stake * (prices - 1))[:, None, :]
+            final_pnl, max_drawdown, ruined = [], [], []
+            realised = None
+
+            # Paths are processed in chunks so memory stays at M x chunk x S
+            for start in range(0, self.n_paths, self.chunk_size):
+                size = min(self.chunk_size, self.n_paths - start)
+                wins = rng.random((n_models, size, n_signals)) < probs[:, None, :]
+                if realised is None:
+                    realised = wins[:, 0, :]
+
+                pnl = np.where(wins, win_pnl, -self.stake)
+                equity = balances + np.cumsum(pnl, axis=2)
+                peak = np.maximum(np.maximum.accumulate(equity, axis=2), balances)
+                drawdown = np.minimum((peak - equity) / np.where(peak > 0, peak, 1.0), 1.0)
+
+                final_pnl.append(equity[:, :, -1] - balances[:, :, 0])
+                max_drawdown.append(drawdown.max(axis=2))
+                ruined.append(equity.min(axis=2) <= ruin_level)
+
+            final_pnl = np.concatenate(final_pnl, axis=1)
+            max_drawdown = np.concatenate(max_drawdown, axis=1)
+            ruined = np.concatenate(ruined, axis=1)
+
+        pnl_q = np.quantile(final_pnl, self.PNL_QUANTILES, axis=1)
+        dd_q = np.quantile(max_drawdown, self.DRAWDOWN_QUANTILES, axis=1)
+
+        results = {}
+        for i, model_id in enumerate(model_ids):
+            results[model_id] = {
+                "n_paths": self.n_paths,
+                "expected_pnl": float(final_pnl[i].mean()),
+                "pnl_std": float(final_pnl[i].std()),
+                "pnl_quantiles": {f"p{int(q * 100):02d}": float(v) for q, v in zip(self.PNL_QUANTILES, pnl_q[:, i])},
+                "drawdown_quantiles": {f"p{int(q * 100):02d}": float(v) for q, v in zip(self.DRAWDOWN_QUANTILES, dd_q[:, i])},
+                "prob_ruin": float(ruined[i].mean()),
+                "realised_wins": realised[i],
+                **{name: float(values[i]) for name, values in side_pnl.items()}
+            }
+        return results
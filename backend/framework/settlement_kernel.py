@@ -0,0 +1,160 @@
+"""
+SETTLEMENT UPGRADE: Array-based Settlement Kernel
+Settles whole slates of legs in one vectorized call instead of one string match per selection.
+
+Supported markets:
+1. 1x2 (Home / Draw / Away)
+2. Totals (Over / Under, including Asian quarter lines)
+3. Asian Handicap (whole, half and quarter lines with half-win / half-loss)
+
+Outcome codes (OUTCOME_*) say what happened to a leg independently of its price; the
+payout factor (amount returned per unit staked) is derived from them:
+    win = odds, half-win = (1 + odds) / 2, push = 1, half-loss = 0.5, loss = 0
+"""
+import re
+import numpy as np
+
+# Market codes
+MARKET_1X2 = 0
+MARKET_TOTAL = 1
+MARKET_AH = 2
+
+# Selection codes
+SEL_HOME = 0
+SEL_AWAY = 1
+SEL_DRAW = 2
+SEL_OVER = 3
+SEL_UNDER = 4
+
+# Outcome codes: a leg is settled as two half-stakes, each scoring 2 (won), 1 (pushed) or 0 (lost)
+OUTCOME_LOSS = 0
+OUTCOME_HALF_LOSS = 1
+OUTCOME_PUSH = 2
+OUTCOME_HALF_WIN = 3
+OUTCOME_WIN = 4
+
+def settle(home_goals, away_goals, market, line, selection, odds, stake):
+    """
+    Vectorized settlement of N legs.
+    All arguments are array-likes of length N (scalars broadcast). `line` is the
+    handicap applied to the selected side (AH) or the goal line (totals); it is
+    ignored for 1x2.
+
+    Returns (payout_factor, pnl) arrays of shape (N,).
+    """
+    factor = payout_factor(outcomes(home_goals, away_goals, market, line, selection), odds)
+    pnl = np.asarray(stake, dtype=float) * (factor - 1)
+    return factor, pnl
+
+def outcomes(home_goals, away_goals, market, line, selection):
+    """Vectorized OUTCOME_* codes of N legs (same arguments as settle, no prices needed)."""
+    h = np.asarray(home_goals, dtype=np.int64)
+    a = np.asarray(away_goals, dtype=np.int64)
+    mkt = np.asarray(market, dtype=np.int64)
+    sel = np.asarray(selection, dtype=np.int64)
+
+    # Work in quarter-goal units so every line is an exact integer
+    q_line = np.rint(np.asarray(line, dtype=float) * 4).astype(np.int64)
+    total = h + a
+    side_diff = np.where(sel == SEL_AWAY, a - h, h - a)
+
+    # Signed margin in quarter units: > 0 wins, == 0 pushes, < 0 loses
+    margin = np.select(
+        [mkt == MARKET_AH, (mkt == MARKET_TOTAL) & (sel == SEL_OVER), mkt == MARKET_TOTAL],
+        [4 * side_diff + q_line, 4 * total - q_line, q_line - 4 * total],
+        default=0
+    )
+
+    # 1x2 never pushes
+    result_1x2 = np.select(
+        [sel == SEL_HOME, sel == SEL_AWAY, sel == SEL_DRAW],
+        [h > a, a > h, h == a],
+        default=False
+    )
+    margin = np.where(mkt == MARKET_1X2, np.where(result_1x2, 1, -1), margin)
+
+    # Quarter lines split the stake across the two neighbouring half/whole lines
+    quarter = (mkt != MARKET_1X2) & (q_line % 2 != 0)
+    lower = np.where(quarter, margin - 1, margin)
+    upper = np.where(quarter, margin + 1, margin)
+
+    return _half_outcome(lower) + _half_outcome(upper)
+
+def _half_outcome(margin):
+    return np.sign(margin) + 1
+
+def payout_factor(outcome, odds):
+    """Payout per unit staked for OUTCOME_* codes at the given decimal odds (vectorized)."""
+    code = np.asarray(outcome, dtype=np.int64)
+    price = np.asarray(odds, dtype=float)
+    # Won halves return odds, pushed halves return the half-stake, lost halves nothing
+    won_halves = np.maximum(code - OUTCOME_PUSH, 0)
+    pushed_halves = np.minimum(code, OUTCOME_WIN - code)
+    return 0.5 * (won_halves * price + pushed_halves)
+
+def ticket_payout_factor(leg_outcomes, leg_odds, total_odds=None):
+    """
+    Payout factor of an accumulator from its legs' OUTCOME_* codes.
+    Legs with their own odds pay exactly; legs without odds get an equal share of
+    total_odds (total_odds ** (1 / n) each), so pushes and half results scale the ticket
+    instead of paying the full price. Returns None when a won or half-won leg has no price.
+    """
+    if OUTCOME_LOSS in leg_outcomes:
+        return 0.0
+    total = float(total_odds or 0)
+    if total > 0 and all(code == OUTCOME_WIN for code in leg_outcomes):
+        return total
+    share = total ** (1 / len(leg_outcomes)) if total > 0 else None
+
+    factor = 1.0
+    for code, odds in zip(leg_outcomes, leg_odds):
+        price = float(odds) if odds else share
+        if price is None:
+            if code > OUTCOME_PUSH:
+                return None
+            price = 1.0 # Pushes and half-losses do not depend on the price
+        factor *= float(payout_factor(code, price))
+    return factor
+
+def parse_selection(selection, home_team, away_team, line=None):
+    """
+    Maps a free-text selection (as stored in legs / picks) to kernel codes.
+    Returns (market, line, selection) or None if the selection is not recognised.
+
+    Examples: "Home Win", "Arsenal", "Draw", "Over 2.5", "Under 2.75",
+              "Home -0.75", "Chelsea +0.25", "AH Away +1"
+    """
+    if not selection:
+        return None
+    text = str(selection).strip()
+    lower = text.lower()
+
+    number = re.search(r'([+-]?\d+(?:\.\d+)?)\s*$', text)
+    parsed_line = float(number.group(1)) if number else line
+
+    if lower.startswith('over'):
+        return (MARKET_TOTAL, parsed_line if parsed_line is not None else 2.5, SEL_OVER)
+    if lower.startswith('under'):
+        return (MARKET_TOTAL, parsed_line if parsed_line is not None else 2.5, SEL_UNDER)
+    if lower == 'draw':
+        return (MARKET_1X2, 0.0, SEL_DRAW)
+
+    # Full-text match first so team names ending in digits ("Schalke 04") stay 1x2
+    side = _match_side(text, home_team, away_team)
+    if side is not None:
+        return (MARKET_1X2, 0.0, side)
+
+    if not number:
+        return None
+    name = re.sub(r'^(ah|asian handicap)\s+', '', text[:number.start()].strip(), flags=re.IGNORECASE)
+    side = _match_side(name, home_team, away_team)
+    if side is None:
+        return None
+    return (MARKET_AH, parsed_line, side)
+
+def _match_side(name, home_team, away_team):
+    if name in (home_team, 'Home', 'Home Win'):
+        return SEL_HOME
+    if name in (away_team, 'Away', 'Away Win'):
+        return SEL_AWAY
+    return None
@@ -6,6 +6,7 @@ from datetime import datetime
 from datetime import datetime
 from dotenv import load_dotenv
 from supabase import create_client, Client
+import supabase_reader
 
 env_path = 'backend/.env'
 load_dotenv(dotenv_path=env_path)
@@ -14,6 +15,8 @@ url: str = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
 key: str = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 supabase: Client = create_client(url, key)
 
+MATCH_COLUMNS = 'id, home_team, away_team, match_time, quant_analysis' # Skip odds_data / models_data
+
 # CONSTANTS - Now redundant but kept for logic
 # MATCHES_FILE = 'public/matches_data_v4.json' 
 # HISTORY_FILE = 'public/parlay_history.json'
@@ -21,25 +24,23 @@ supabase: Client = create_client(url, key)
 def generate_daily_picks():
     print("[PARLAY_BOT] Auto-generating Daily Official Picks...")
     
-    # 1. Load Matches
-    # 1. Load Matches from DB
-    response = supabase.table('matches').select('*').execute()
-    matches = response.data
+    today_str = datetime.now().strftime('%Y-%m-%d')
 
-    if not matches:
-        return
-    
-    # Pre-process matches to match old structure if needed
-    # The DB structure is flat: {id, quant_analysis, ...}
-    # My logic below expects 'quant_analysis' in m
+    # 1. Stream upcoming Matches from DB (projected, keyset-paginated)
+    matches = supabase_reader.stream_rows(supabase, 'matches', MATCH_COLUMNS, filters=[
+        ('gte', 'match_time', today_str)
+    ])
+
+    # The DB structure is flat: {id, home_team, away_team, quant_analysis, ...}
 
     # 2. Strategy: Select Best "Safe" Picks (High Confidence, Positive Edge)
     candidates = []
     for m in matches:
-        rec = m.get('quant_analysis', {}).get('recommendations', {}).get('1x2')
+        rec = (m.get('quant_analysis') or {}).get('recommendations', {}).get('1x2')
         if rec and rec.get('confidence', 0) >= 6 and float(rec.get('value_gap', '0').replace('%','')) > 0:
+            teams = m.get('match_info') or m
             candidates.append({
-                'match': f"{m['match_info']['home_team']} vs {m['match_info']['away_team']}",
+                'match': f"{teams['home_team']} vs {teams['away_team']}",
                 'selection': rec['selection'],
                 'market': 'Moneyline',
                 'odds': rec['market_odds'],
@@ -54,7 +55,6 @@ def generate_daily_picks():
         return
 
     # 3. Create Tickets for different strategies
-    today_str = datetime.now().strftime('%Y-%m-%d')
     new_tickets = []
 
     # Strategy Configs
@@ -110,7 +110,7 @@ def generate_daily_picks():
             print(f"Skipping strategy {strat['name']}: {e}")
 
     # 4. Save to Supabase
-    existing_today = supabase.table('parlay_tickets').select('*').eq('date', today_str).ilike('verified_on', '%QuantChain%').execute()
+    existing_today = supabase.table('parlay_tickets').select('id').eq('date', today_str).ilike('verified_on', '%QuantChain%').limit(1).execute()
     
     if not existing_today.data:
         print(f"[PARLAY_BOT] 🆕 Generated {len(new_tickets)} System Tickets for {today_str}")
@@ -134,8 +134,6 @@ def generate_daily_picks():
     else:
         print("[PARLAY_BOT] ✅ System Tickets for today already exist. Skipping.")
         # Optional: Print existing for confirmation?
-    else:
-        print("[PARLAY_BOT] ✅ System Tickets for today already exist. Skipping.")
 
 if __name__ == "__main__":
     generate_daily_picks()
@@ -2,9 +2,10 @@ import json
 import os
 from datetime import datetime
 from pathlib import Path
+import json_export
 
-SIGNAL_PATH = Path('c:/Users/nirva/quantgoal.ai/public/matches_data_v4.json')
-TOP_PICKS_PATH = Path('c:/Users/nirva/quantgoal.ai/public/daily_top_picks.json')
+SIGNAL_PATH = Path(json_export.public_path('matches_data_v4.json'))
+TOP_PICKS_PATH = Path(json_export.public_path('daily_top_picks.json'))
 
 # 7 AI Participants (6 models + consensus)
 MODELS = [
@@ -182,27 +183,27 @@ def generate_top_picks():
             except:
                 history = {}
     
-    # Generate picks for each model
-    for model_name in MODELS:
-        model_picks = generate_model_picks(signals, model_name, today)
+    # Generate picks model by model, streaming each merged history straight to disk
+    # (atomic replace; the frontend polls this file)
+    with json_export.JsonObjectWriter(TOP_PICKS_PATH, pretty=True) as out:
+        for model_name in MODELS:
+            model_picks = generate_model_picks(signals, model_name, today)
+            model_history = history.pop(model_name, [])
+            
+            # Update or add new picks
+            for new_pick in model_picks:
+                idx = next((i for i, item in enumerate(model_history) if item["id"] == new_pick["id"]), None)
+                if idx is not None:
+                    model_history[idx] = new_pick
+                else:
+                    model_history.insert(0, new_pick)
+            
+            out.write(model_name, model_history)
+            print(f"{model_name}: {len(model_picks)} picks generated")
         
-        # Initialize model's history list if needed
-        if model_name not in history:
-            history[model_name] = []
-        
-        # Update or add new picks
-        for new_pick in model_picks:
-            idx = next((i for i, item in enumerate(history[model_name]) if item["id"] == new_pick["id"]), None)
-            if idx is not None:
-                history[model_name][idx] = new_pick
-            else:
-                history[model_name].insert(0, new_pick)
-        
-        print(f"{model_name}: {len(model_picks)} picks generated")
-    
-    # Save all picks
-    with open(TOP_PICKS_PATH, 'w', encoding='utf-8') as f:
-        json.dump(history, f, indent=2, ensure_ascii=False)
+        # Keep history of models no longer in the lineup
+        for model_name, model_history in history.items():
+            out.write(model_name, model_history)
     
     print(f"\nDaily Diamond 4 generated for {today}")
     print(f"Total: {len(MODELS)} models × 4 picks = {len(MODELS) * 4} picks")
@@ -1,49 +1,207 @@
+"""
+Guilds: pooled-capital teams competing on ROI.
+
+Guilds live in quantgoal_core.db (guilds / guild_history, see migrations.py). A PnL update
+is one short write transaction touching one guild row and one history row, so concurrent
+writers serialize on SQLite's lock instead of overwriting each other, and nothing else is
+rewritten. ROI is maintained on every update; rank is read off the (roi, id) index. Daily
+history is a per-guild ring buffer: appending trims rows beyond HISTORY_DAYS.
+
+public/guilds_data.json is an exported snapshot for the frontend (history newest first),
+refreshed at most every SNAPSHOT_INTERVAL seconds and on exit.
+"""
+import atexit
 import json
 import os
+import time
 from datetime import datetime
+import db
+import migrations
+import json_export
 
 GUILDS_DATA_PATH = os.path.join(os.path.dirname(__file__), '../public/guilds_data.json')
 
+HISTORY_DAYS = 90 # Ring buffer capacity per guild
+SNAPSHOT_INTERVAL = 60 # seconds
+
+_store_ready = False
+_last_snapshot = 0.0
+_snapshot_stale = False
+
 def get_guilds():
-    if not os.path.exists(GUILDS_DATA_PATH):
-        return {"guilds": []}
-    with open(GUILDS_DATA_PATH, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    """Every guild in the legacy JSON shape ({"guilds": [...], "next_id": n})."""
+    _ensure_store()
+    with db.connection() as conn:
+        rows = conn.execute("SELECT * FROM guilds ORDER BY roi DESC, id").fetchall()
+        history = {}
+        for row in conn.execute("SELECT guild_id, date, pnl, capital FROM guild_history ORDER BY guild_id, id DESC"):
+            history.setdefault(row['guild_id'], []).append(_history_dict(row))
+        next_id = _next_seq(conn)
+
+    guilds = [_guild_dict(row, rank, history.get(row['id'], [])) for rank, row in enumerate(rows, 1)]
+    guilds.sort(key=lambda g: _id_number(g['id'])) # Creation order, as before
+    return {"guilds": guilds, "next_id": next_id}
+
+def get_guild(guild_id):
+    """One guild with its rank and history, or None if unknown."""
+    _ensure_store()
+    with db.connection() as conn:
+        return _load_guild(conn, guild_id)
 
 def create_guild(name, founder, initial_capital=10000):
-    data = get_guilds()
-    new_guild = {
-        "id": f"guild_{len(data['guilds']) + 1}",
-        "name": name,
-        "founder": founder,
-        "created_at": datetime.now().isoformat(),
-        "total_capital": initial_capital,
-        "members": [{"user": founder, "contribution": initial_capital}],
+    _ensure_store()
+    with db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.execute('''
+            INSERT INTO guilds (name, founder, created_at, total_capital, members)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (name, founder, datetime.now().isoformat(), initial_capital,
+              json.dumps([{"user": founder, "contribution": initial_capital}])))
+        guild_id = f"guild_{cur.lastrowid}"
+        conn.execute("UPDATE guilds SET id = ? WHERE seq = ?", (guild_id, cur.lastrowid))
+        guild = _load_guild(conn, guild_id)
+    _mark_changed()
+    return guild
+
+def delete_guild(guild_id):
+    _ensure_store()
+    with db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        deleted = conn.execute("DELETE FROM guilds WHERE id = ?", (guild_id,)).rowcount > 0
+        conn.execute("DELETE FROM guild_history WHERE guild_id = ?", (guild_id,))
+    if deleted:
+        _mark_changed()
+    return deleted
+
+def update_guild_performance(guild_id, daily_pnl, date=None):
+    """Adds one day's PnL to one guild: a single-row update plus one history row."""
+    return update_guilds_performance({guild_id: daily_pnl}, date) > 0
+
+def update_guilds_performance(daily_pnls, date=None):
+    """End-of-day update for many guilds at once ({guild_id: pnl}), in one transaction."""
+    _ensure_store()
+    date = date or datetime.now().strftime('%Y-%m-%d')
+    with db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        updated = sum(1 for guild_id, pnl in daily_pnls.items() if _record_pnl(conn, guild_id, pnl, date))
+    if updated:
+        _mark_changed()
+    return updated
+
+def export_snapshot():
+    """Writes public/guilds_data.json atomically from the store."""
+    global _last_snapshot, _snapshot_stale
+    json_export.write_json(GUILDS_DATA_PATH, get_guilds())
+    _last_snapshot = time.time()
+    _snapshot_stale = False
+
+def _record_pnl(conn, guild_id, daily_pnl, date):
+    row = conn.execute("SELECT total_capital, total_pnl FROM guilds WHERE id = ?", (guild_id,)).fetchone()
+    if row is None:
+        return False
+    capital = row['total_capital'] or 0
+    total_pnl = row['total_pnl'] + daily_pnl
+    roi = round((total_pnl / capital) * 100, 2) if capital else 0.0
+    conn.execute("UPDATE guilds SET total_pnl = ?, roi = ? WHERE id = ?", (total_pnl, roi, guild_id))
+    conn.execute(
+        "INSERT INTO guild_history (guild_id, date, pnl, capital) VALUES (?, ?, ?, ?)",
+        (guild_id, date, daily_pnl, capital + total_pnl)
+    )
+    # Ring buffer: drop whatever fell past capacity (at most one row per append)
+    conn.execute('''
+        DELETE FROM guild_history WHERE guild_id = ? AND id <= (
+            SELECT id FROM guild_history WHERE guild_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+        )
+    ''', (guild_id, guild_id, HISTORY_DAYS))
+    return True
+
+def _load_guild(conn, guild_id):
+    row = conn.execute("SELECT * FROM guilds WHERE id = ?", (guild_id,)).fetchone()
+    if row is None:
+        return None
+    ahead = conn.execute(
+        "SELECT COUNT(*) FROM guilds WHERE roi > ? OR (roi = ? AND id < ?)", (row['roi'], row['roi'], guild_id)
+    ).fetchone()[0]
+    history = conn.execute(
+        "SELECT date, pnl, capital FROM guild_history WHERE guild_id = ? ORDER BY id DESC", (guild_id,)
+    ).fetchall()
+    return _guild_dict(row, ahead + 1, [_history_dict(h) for h in history])
+
+def _guild_dict(row, rank, history):
+    return {
+        "id": row['id'],
+        "name": row['name'],
+        "founder": row['founder'],
+        "created_at": row['created_at'],
+        "total_capital": row['total_capital'],
+        "members": json.loads(row['members'] or '[]'),
         "stats": {
-            "total_pnl": 0.0,
-            "roi": 0.0,
-            "rank": len(data['guilds']) + 1
+            "total_pnl": row['total_pnl'],
+            "roi": row['roi'],
+            "rank": rank
         },
-        "history": []
+        "history": history
     }
-    data['guilds'].append(new_guild)
-    _save_guilds(data)
-    return new_guild
-
-def update_guild_performance(guild_id, daily_pnl):
-    data = get_guilds()
-    for guild in data['guilds']:
-        if guild['id'] == guild_id:
-            guild['stats']['total_pnl'] += daily_pnl
-            guild['stats']['roi'] = round((guild['stats']['total_pnl'] / guild['total_capital']) * 100, 2)
-            guild['history'].insert(0, {
-                "date": datetime.now().strftime('%Y-%m-%d'),
-                "pnl": daily_pnl,
-                "capital": guild['total_capital'] + guild['stats']['total_pnl']
-            })
-            break
-    _save_guilds(data)
-
-def _save_guilds(data):
-    with open(GUILDS_DATA_PATH, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+
+def _history_dict(row):
+    return {"date": row['date'], "pnl": row['pnl'], "capital": row['capital']}
+
+def _next_seq(conn):
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'guilds'").fetchone()
+    return (row[0] if row else 0) + 1
+
+def _id_number(guild_id):
+    try:
+        return int(str(guild_id).rsplit('_', 1)[-1])
+    except ValueError:
+        return 0
+
+def _mark_changed():
+    global _snapshot_stale
+    _snapshot_stale = True
+    if time.time() - _last_snapshot >= SNAPSHOT_INTERVAL:
+        export_snapshot()
+
+def _ensure_store():
+    """Applies pending migrations and, on first run, imports the legacy guilds_data.json."""
+    global _store_ready
+    if _store_ready:
+        return
+    with db.connection() as conn:
+        migrations.migrate(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        empty = conn.execute("SELECT COUNT(*) FROM guilds").fetchone()[0] == 0
+        if empty and os.path.exists(GUILDS_DATA_PATH):
+            _import_legacy(conn)
+    _store_ready = True
+
+def _import_legacy(conn):
+    try:
+        with open(GUILDS_DATA_PATH, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (ValueError, OSError):
+        return
+    for guild in data.get('guilds', []):
+        stats = guild.get('stats', {})
+        conn.execute('''
+            INSERT INTO guilds (seq, id, name, founder, created_at, total_capital, members, total_pnl, roi)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (_id_number(guild['id']) or None, guild['id'], guild.get('name'), guild.get('founder'),
+              guild.get('created_at'), guild.get('total_capital'), json.dumps(guild.get('members', [])),
+              stats.get('total_pnl', 0.0), stats.get('roi', 0.0)))
+        # Stored newest first: keep the newest HISTORY_DAYS, inserted oldest first so ids follow time
+        history = guild.get('history', [])[:HISTORY_DAYS]
+        conn.executemany(
+            "INSERT INTO guild_history (guild_id, date, pnl, capital) VALUES (?, ?, ?, ?)",
+            [(guild['id'], h.get('date'), h.get('pnl'), h.get('capital')) for h in reversed(history)]
+        )
+    # Ids are never reused, even after the highest one was deleted
+    next_id = data.get('next_id', 1)
+    if _next_seq(conn) < next_id:
+        conn.execute("DELETE FROM sqlite_sequence WHERE name = 'guilds'")
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('guilds', ?)", (next_id - 1,))
+
+@atexit.register
+def _close():
+    if _snapshot_stale:
+        export_snapshot()
@@ -33,3 +33,129 @@ def verify_signature(signature_data):
     recalc_hash = hashlib.sha256(payload.encode('utf-8')).hexdigest()
     
     return recalc_hash == claimed_hash
+
+# --- MERKLE BATCHING ---
+# One tree per save cycle: every prediction (consensus included) is a leaf, only the
+# root is stored / anchored, and each row keeps the sibling path up to that root.
+# Leaves are the existing per-record hashes; inner nodes are prefixed with 0x01 so a
+# leaf can never be passed off as an inner node.
+
+NODE_PREFIX = b'\x01'
+
+def _node_hash(left, right):
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+def build_merkle_levels(leaf_hashes):
+    """
+    Builds the tree bottom-up from hex leaf hashes.
+    Returns a list of levels (raw bytes), levels[0] = leaves, levels[-1] = [root].
+    An unpaired last node is carried up unchanged (never duplicated).
+    """
+    level = [bytes.fromhex(h) for h in leaf_hashes]
+    if not level:
+        raise ValueError("Cannot build a Merkle tree with no leaves")
+    levels = [level]
+    while len(level) > 1:
+        nxt = [_node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            nxt.append(level[-1])
+        levels.append(nxt)
+        level = nxt
+    return levels
+
+def merkle_root(leaf_hashes):
+    return build_merkle_levels(leaf_hashes)[-1][0].hex()
+
+def merkle_proof(levels, index):
+    """
+    Inclusion proof for leaf `index`: one 'L'/'R' + 64 hex chars step per level,
+    comma separated ('L' = sibling is on the left). Empty string for a single-leaf tree.
+    """
+    steps = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            steps.append(('L' if sibling < index else 'R') + level[sibling].hex())
+        index //= 2
+    return ",".join(steps)
+
+def verify_inclusion(leaf_hash, proof, root):
+    """O(log n) check that `leaf_hash` is part of the tree with `root`."""
+    node = bytes.fromhex(leaf_hash)
+    for step in proof.split(",") if proof else []:
+        sibling = bytes.fromhex(step[1:])
+        node = _node_hash(sibling, node) if step[0] == 'L' else _node_hash(node, sibling)
+    return node.hex() == root
+
+def sign_prediction_batch(records, timestamp=None):
+    """
+    Signs a whole cycle at once.
+    `records` is a list of (match_id, model_name, prediction) tuples.
+    Returns {"root", "timestamp", "leaf_count", "signatures"} where signatures[i] is
+    the usual signature dict plus "leaf_index" and "proof" for records[i].
+    """
+    if timestamp is None:
+        timestamp = int(time.time())
+
+    signatures = [generate_prediction_signature(m, model, pred, timestamp) for m, model, pred in records]
+    levels = build_merkle_levels([s['hash'] for s in signatures])
+    for i, sig in enumerate(signatures):
+        sig['leaf_index'] = i
+        sig['proof'] = merkle_proof(levels, i)
+
+    return {
+        "root": levels[-1][0].hex(),
+        "timestamp": timestamp,
+        "leaf_count": len(signatures),
+        "signatures": signatures
+    }
+
+def verify_prediction_batches(rows, get_batch):
+    """
+    Bulk verifier: ONE streaming pass over prediction rows.
+
+    `rows` yields (id, batch_id, leaf_index, match_id, model_name, prediction, timestamp,
+    integrity_hash, proof) ordered by (batch_id, leaf_index); `get_batch(batch_id)` returns
+    (root, leaf_count) or None. Only one batch of leaf hashes is held in memory at a time.
+
+    Complete batches are checked by rebuilding the root (O(n)); batches that are only
+    partly present (e.g. some fixtures archived) fall back to per-row proofs (O(log n) each).
+    Rows signed before batching (batch_id NULL) only get their record hash checked.
+    """
+    report = {"rows": 0, "batches": 0, "legacy_rows": 0, "invalid_rows": [], "invalid_batches": [], "partial_batches": []}
+
+    def check_batch(batch_id, batch):
+        report["batches"] += 1
+        meta = get_batch(batch_id)
+        if meta is None:
+            report["invalid_batches"].append(batch_id)
+            report["invalid_rows"].extend(row_id for row_id, _, _, _ in batch)
+            return
+        root, leaf_count = meta
+        complete = len(batch) == leaf_count and all(row[1] == i for i, row in enumerate(batch))
+        if complete and merkle_root([leaf for _, _, leaf, _ in batch]) == root:
+            return
+        report["invalid_batches" if complete else "partial_batches"].append(batch_id)
+        report["invalid_rows"].extend(
+            row_id for row_id, _, leaf, proof in batch if not verify_inclusion(leaf, proof or "", root)
+        )
+
+    current_id, batch = None, []
+    for row_id, batch_id, leaf_index, match_id, model_name, prediction, timestamp, stored_hash, proof in rows:
+        report["rows"] += 1
+        leaf = generate_prediction_signature(match_id, model_name, prediction, timestamp)['hash']
+        if leaf != stored_hash:
+            report["invalid_rows"].append(row_id)
+        if batch_id is None:
+            report["legacy_rows"] += 1
+            continue
+        if batch_id != current_id:
+            if batch:
+                check_batch(current_id, batch)
+            current_id, batch = batch_id, []
+        batch.append((row_id, leaf_index, leaf, proof))
+    if batch:
+        check_batch(current_id, batch)
+
+    report["invalid_rows"] = sorted(set(report["invalid_rows"]))
+    return report
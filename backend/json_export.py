@@ -0,0 +1,127 @@
+"""
+Shared streaming export layer for the public/*.json frontend snapshots.
+
+- JsonArrayWriter streams records into a JSON array as they are produced, so peak memory
+  no longer depends on slate size. JsonObjectWriter does the same for {key: value} files.
+- write_json dumps a single (already small) object, e.g. the leaderboard.
+- Both write to a temp file in the target directory and os.replace() it into place, so
+  readers (Next.js, other jobs) never see a half-written file.
+- orjson is used when installed; the stdlib json module otherwise.
+"""
+import json
+import os
+import tempfile
+
+try:
+    import orjson
+except ImportError: # Optional fast serializer
+    orjson = None
+
+PUBLIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'public')
+
+def public_path(filename):
+    return os.path.join(PUBLIC_DIR, filename)
+
+def dumps(obj, pretty=False):
+    """Serializes one value to a str (pretty = 2-space indent, compact otherwise)."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option).decode('utf-8')
+    if pretty:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+class _AtomicFile:
+    """Text file written to a sibling temp path and renamed over the target on success."""
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._file = None
+        self._tmp_path = None
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(self.path), suffix='.tmp')
+        self._file = os.fdopen(fd, 'w', encoding='utf-8')
+        return self._file
+
+    def commit(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.chmod(self._tmp_path, 0o644) # mkstemp creates 0600; snapshots are public
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+class JsonArrayWriter:
+    """
+    Streams records into a JSON array file.
+
+        with JsonArrayWriter(public_path('matches_data.json'), pretty=True) as out:
+            for match in matches:
+                out.write(analyse(match))
+
+    The target file is only replaced when the block exits without an exception.
+    """
+    OPEN, CLOSE = '[', ']'
+
+    def __init__(self, path, pretty=False):
+        self.pretty = pretty
+        self.count = 0
+        self._atomic = _AtomicFile(path)
+        self._file = None
+
+    def __enter__(self):
+        self._file = self._atomic.open()
+        self._file.write(self.OPEN)
+        return self
+
+    def write(self, record):
+        self._write_item(dumps(record, pretty=self.pretty))
+
+    def _write_item(self, text):
+        if self.pretty:
+            # Same layout as json.dump(list / dict, indent=2)
+            text = '\n' + '\n'.join('  ' + line for line in text.split('\n'))
+        self._file.write(text if self.count == 0 else ',' + text)
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._atomic.abort()
+            return False
+        self._file.write('\n' + self.CLOSE if self.pretty and self.count else self.CLOSE)
+        self._atomic.commit()
+        return False
+
+class JsonObjectWriter(JsonArrayWriter):
+    """
+    Streams members into a JSON object file, one key at a time.
+
+        with JsonObjectWriter(public_path('daily_top_picks.json'), pretty=True) as out:
+            for model in models:
+                out.write(model, picks_for(model))
+    """
+    OPEN, CLOSE = '{', '}'
+
+    def write(self, key, value):
+        separator = ': ' if self.pretty else ':'
+        self._write_item(dumps(str(key)) + separator + dumps(value, pretty=self.pretty))
+
+def write_json(path, obj, pretty=True):
+    """Atomically writes a single JSON value."""
+    atomic = _AtomicFile(path)
+    f = atomic.open()
+    try:
+        f.write(dumps(obj, pretty=pretty))
+    except Exception:
+        atomic.abort()
+        raise
+    atomic.commit()
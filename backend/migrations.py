@@ -0,0 +1,296 @@
+"""
+Versioned schema migrations for quantgoal_core.db.
+
+Each migration runs exactly once, in order, inside its own write transaction, and is
+recorded in `schema_version`. Statements stay idempotent (IF NOT EXISTS; _add_column for
+columns, since SQLite has no ADD COLUMN IF NOT EXISTS) so databases created before
+versioning existed upgrade cleanly.
+
+To change the schema: APPEND a new (version, description, [statements]) entry.
+Never edit a migration that has already shipped.
+"""
+from datetime import datetime
+
+def _add_column(table, column, declaration):
+    """Migration step: ALTER TABLE ... ADD COLUMN, skipped when PRAGMA table_info already lists it."""
+    def step(conn):
+        if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+    return step
+
+MIGRATIONS = [
+    (1, "Core tables", [
+        # 1. Matches Table (The ground truth)
+        '''
+        CREATE TABLE IF NOT EXISTS matches (
+            id TEXT PRIMARY KEY, -- fixture_id
+            league TEXT,
+            home_team TEXT,
+            away_team TEXT,
+            date TEXT,
+            status TEXT,
+            final_home_score INTEGER,
+            final_away_score INTEGER,
+            winner TEXT -- 'Home', 'Away', 'Draw'
+        )
+        ''',
+        # 2. Predictions Table ( The AI Votes ) with integrity_hash and integrity_ts
+        '''
+        CREATE TABLE IF NOT EXISTS predictions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            match_id TEXT,
+            model_name TEXT,
+            prediction_target TEXT, -- 'Home', 'Away', 'Draw'
+            confidence INTEGER,
+            logic TEXT,
+            is_correct BOOLEAN DEFAULT NULL,
+            integrity_hash TEXT,
+            integrity_ts INTEGER,
+            FOREIGN KEY (match_id) REFERENCES matches (id)
+        )
+        ''',
+        # 3. Consensus/Financial Table (The System's Call)
+        '''
+        CREATE TABLE IF NOT EXISTS consensus_signals (
+            match_id TEXT PRIMARY KEY,
+            signal_type TEXT,
+            ev_percent REAL,
+            kelly_stake REAL,
+            market_odds_home REAL,
+            market_odds_away REAL,
+            market_odds_draw REAL,
+            FOREIGN KEY (match_id) REFERENCES matches (id)
+        )
+        ''',
+        # 4. Performance Ledger (The Leaderboard Source)
+        '''
+        CREATE TABLE IF NOT EXISTS model_performance (
+            model_name TEXT,
+            date TEXT,
+            daily_pnl REAL,
+            total_pnl REAL,
+            strike_rate REAL,
+            PRIMARY KEY (model_name, date)
+        )
+        '''
+    ]),
+    (2, "Indexes for grading, settlement and leaderboard queries", [
+        # grade_predictions: join predictions -> matches on match_id, ungraded rows only
+        "CREATE INDEX IF NOT EXISTS idx_predictions_match ON predictions (match_id, is_correct)",
+        # update_leaderboard_json: per-model COUNT/SUM over graded rows
+        "CREATE INDEX IF NOT EXISTS idx_predictions_model_correct ON predictions (model_name, is_correct)",
+        # settle_matches_simulated / grading: matches with (or without) a result
+        "CREATE INDEX IF NOT EXISTS idx_matches_winner ON matches (winner)",
+        # History windows by fixture date
+        "CREATE INDEX IF NOT EXISTS idx_matches_date ON matches (date)",
+        "ANALYZE"
+    ]),
+    (3, "model_performance as an incrementally maintained per-model, per-day view", [
+        # bets / wins / daily_pnl are per day; total_* and strike_rate are running (cumulative) values
+        _add_column("model_performance", "bets", "INTEGER DEFAULT 0"),
+        _add_column("model_performance", "wins", "INTEGER DEFAULT 0"),
+        _add_column("model_performance", "total_bets", "INTEGER DEFAULT 0"),
+        _add_column("model_performance", "total_wins", "INTEGER DEFAULT 0"),
+        # Backfill from already graded history ($100 flat stake at the stored consensus odds)
+        "DELETE FROM model_performance",
+        '''
+        INSERT INTO model_performance (model_name, date, bets, wins, daily_pnl, total_pnl, strike_rate, total_bets, total_wins)
+        SELECT
+            p.model_name,
+            substr(m.date, 1, 10),
+            COUNT(*),
+            SUM(p.is_correct),
+            SUM(CASE WHEN p.is_correct THEN 100 * (COALESCE(
+                    CASE p.prediction_target
+                        WHEN 'Home' THEN cs.market_odds_home
+                        WHEN 'Away' THEN cs.market_odds_away
+                        ELSE cs.market_odds_draw
+                    END, 1.95) - 1)
+                ELSE -100 END),
+            0, 0, 0, 0
+        FROM predictions p
+        JOIN matches m ON m.id = p.match_id
+        LEFT JOIN consensus_signals cs ON cs.match_id = p.match_id
+        WHERE p.is_correct IS NOT NULL
+        GROUP BY p.model_name, substr(m.date, 1, 10)
+        ''',
+        '''
+        UPDATE model_performance
+        SET total_pnl = (SELECT SUM(mp.daily_pnl) FROM model_performance mp
+                         WHERE mp.model_name = model_performance.model_name AND mp.date <= model_performance.date),
+            total_bets = (SELECT SUM(mp.bets) FROM model_performance mp
+                          WHERE mp.model_name = model_performance.model_name AND mp.date <= model_performance.date),
+            total_wins = (SELECT SUM(mp.wins) FROM model_performance mp
+                          WHERE mp.model_name = model_performance.model_name AND mp.date <= model_performance.date)
+        ''',
+        "UPDATE model_performance SET strike_rate = ROUND(total_wins * 100.0 / total_bets, 1) WHERE total_bets > 0"
+    ]),
+    (4, "Merkle-batched integrity signatures", [
+        # One row per save cycle: only the root is stored / timestamped / anchored
+        '''
+        CREATE TABLE IF NOT EXISTS integrity_batches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            merkle_root TEXT NOT NULL,
+            leaf_count INTEGER NOT NULL,
+            signed_ts INTEGER NOT NULL,
+            anchor_ref TEXT -- external anchor (tx id / publication url) once published
+        )
+        ''',
+        # Each prediction keeps its position in the cycle tree and its inclusion proof
+        _add_column("predictions", "integrity_batch_id", "INTEGER REFERENCES integrity_batches (id)"),
+        _add_column("predictions", "merkle_leaf_index", "INTEGER"),
+        _add_column("predictions", "merkle_proof", "TEXT"),
+        # Bulk verifier streams predictions in tree order
+        "CREATE INDEX IF NOT EXISTS idx_predictions_integrity_batch ON predictions (integrity_batch_id, merkle_leaf_index)"
+    ]),
+    (5, "Arena Coin economy store", [
+        # One balance row per user, updated in place
+        '''
+        CREATE TABLE IF NOT EXISTS economy_users (
+            user_id TEXT PRIMARY KEY,
+            balance INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT
+        )
+        ''',
+        # Append-only coin movements (GRANT / PURCHASE / ...)
+        '''
+        CREATE TABLE IF NOT EXISTS economy_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL REFERENCES economy_users (user_id),
+            timestamp TEXT NOT NULL,
+            type TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            package TEXT,
+            price_usd REAL,
+            description TEXT
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_economy_transactions_user ON economy_transactions (user_id, id)",
+        # Global counters kept alongside every write instead of re-summed
+        '''
+        CREATE TABLE IF NOT EXISTS economy_stats (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        "INSERT OR IGNORE INTO economy_stats (key, value) VALUES ('total_coins_issued', 0), ('total_burn', 0)"
+    ]),
+    (6, "Completed score events seen by the settlement poller", [
+        # Final scores never change, so a completed event is fetched from the Odds API once
+        '''
+        CREATE TABLE IF NOT EXISTS completed_events (
+            event_id TEXT PRIMARY KEY,
+            sport_key TEXT,
+            home_team TEXT,
+            away_team TEXT,
+            commence_time TEXT,
+            payload TEXT NOT NULL, -- raw API event (scores included)
+            recorded_at TEXT
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_completed_events_commence ON completed_events (commence_time)"
+    ]),
+    (7, "Inverted match -> open parlay leg index for settlement_engine", [
+        # One row per still-open leg of a PENDING parlay_tickets row (Supabase id)
+        '''
+        CREATE TABLE IF NOT EXISTS ticket_leg_index (
+            match_key TEXT NOT NULL, -- normalized 'home|away'
+            ticket_uuid TEXT NOT NULL,
+            leg_pos INTEGER NOT NULL,
+            match TEXT, -- leg's original "Home vs Away"
+            ticket_date TEXT, -- legs carry no kickoff; results before this date are ignored
+            PRIMARY KEY (match_key, ticket_uuid, leg_pos)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_ticket_leg_index_ticket ON ticket_leg_index (ticket_uuid)",
+        # Watermarks (e.g. created_at of the newest ticket already indexed)
+        '''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            name TEXT PRIMARY KEY,
+            value TEXT
+        )
+        '''
+    ]),
+    (8, "Team -> league lookup for settlement legs without a league", [
+        # Learned from every polled score event; sport_key NULL = not found in any covered league
+        '''
+        CREATE TABLE IF NOT EXISTS team_sports (
+            team_key TEXT PRIMARY KEY, -- normalize_team(name)
+            sport_key TEXT,
+            seen_at TEXT
+        )
+        '''
+    ]),
+    (9, "Guild store (guilds_manager)", [
+        '''
+        CREATE TABLE IF NOT EXISTS guilds (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT, -- never reused, so ids survive deletions
+            id TEXT UNIQUE, -- 'guild_<seq>'
+            name TEXT,
+            founder TEXT,
+            created_at TEXT,
+            total_capital REAL,
+            members TEXT, -- JSON list of {user, contribution}
+            total_pnl REAL NOT NULL DEFAULT 0,
+            roi REAL NOT NULL DEFAULT 0
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_guilds_roi ON guilds (roi DESC, id)",
+        # Per-guild ring buffer of daily results, trimmed to guilds_manager.HISTORY_DAYS on append
+        '''
+        CREATE TABLE IF NOT EXISTS guild_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id TEXT NOT NULL,
+            date TEXT,
+            pnl REAL,
+            capital REAL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_guild_history_guild ON guild_history (guild_id, id)"
+    ]),
+]
+
+def current_version(conn):
+    _ensure_version_table(conn)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def migrate(conn):
+    """Applies every pending migration in order. Returns the list of versions applied."""
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= current_version(conn):
+            continue
+
+        # IMMEDIATE takes the write lock up front; re-check in case another process won the race
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= current_version(conn):
+                conn.rollback()
+                continue
+            for sql in statements:
+                if callable(sql):
+                    sql(conn)
+                else:
+                    conn.execute(sql)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.now().isoformat())
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        print(f"[DB] Applied migration {version}: {description}")
+        applied.append(version)
+    return applied
+
+def _ensure_version_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TEXT
+    )
+    ''')
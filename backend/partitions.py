@@ -0,0 +1,223 @@
+"""
+Time-partitioned storage for quantgoal_core.db.
+
+The main database stays HOT: it only holds the last HOT_MONTHS months of fixtures, so the
+settle / grade / leaderboard queries (and VACUUM) cost the same no matter how much history
+piles up. Older months are moved into one read-only SQLite file per month under
+partitions/ next to the database (backend/partitions/ for the default one), and
+PartitionRouter ATTACHes only the partitions a query's date range actually needs.
+
+Partitions carry only the PARTITIONED_TABLES schema (copied from the hot database), and
+every read opens them through 'file:...?mode=ro' URIs, so readers cannot modify an archive
+whatever their file permissions. model_performance is an aggregate and stays in the hot
+database, as does integrity_batches (archived predictions still verify against it).
+"""
+import heapq
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+import db
+
+PARTITION_DIR_NAME = "partitions" # Created next to the database it archives
+HOT_MONTHS = 2 # Current month + previous month stay in the main database
+MAX_ATTACHED = 8 # SQLite's default compile-time limit is 10 attached databases
+
+# Tables moved with their fixtures, in dependency order
+PARTITIONED_TABLES = [
+    ("matches", "id"),
+    ("predictions", "match_id"),
+    ("consensus_signals", "match_id"),
+]
+
+def partition_dir(path=None):
+    """Archive directory of the database at `path` (default: db.DB_NAME)."""
+    return os.path.join(os.path.dirname(os.path.abspath(path or db.DB_NAME)), PARTITION_DIR_NAME)
+
+def partition_path(month, path=None):
+    """month: 'YYYY-MM'"""
+    return os.path.join(partition_dir(path), f"quantgoal_{month.replace('-', '_')}.db")
+
+def partition_uri(month, path=None):
+    return Path(partition_path(month, path)).as_uri() + "?mode=ro"
+
+def open_partition(month, path=None):
+    """Read-only connection to one archived month. Caller closes it."""
+    conn = sqlite3.connect(partition_uri(month, path), uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def list_partitions(path=None):
+    """Sorted list of archived months ('YYYY-MM') of the database at `path`."""
+    directory = partition_dir(path)
+    if not os.path.isdir(directory):
+        return []
+    months = []
+    for name in os.listdir(directory):
+        if name.startswith("quantgoal_") and name.endswith(".db"):
+            months.append(name[len("quantgoal_"):-len(".db")].replace('_', '-'))
+    return sorted(months)
+
+def hot_cutoff(now=None, hot_months=HOT_MONTHS):
+    """First month ('YYYY-MM') that stays in the hot database."""
+    now = now or datetime.now()
+    index = now.year * 12 + (now.month - 1) - (hot_months - 1)
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+def archive_cold_partitions(hot_months=HOT_MONTHS, now=None, path=None):
+    """
+    Moves fully settled and graded fixtures older than the hot window into monthly partitions.
+    Safe to re-run: rows are copied with INSERT OR REPLACE before being deleted from the hot DB.
+    Returns {month: fixtures moved}.
+    """
+    cutoff = hot_cutoff(now, hot_months)
+    moved = {}
+
+    with db.connection(path) as conn:
+        months = [r[0] for r in conn.execute(
+            "SELECT DISTINCT substr(date, 1, 7) FROM matches WHERE date < ? AND winner IS NOT NULL",
+            (cutoff,)
+        ).fetchall() if r[0]]
+
+    for month in months:
+        count = _archive_month(month, path)
+        if count:
+            moved[month] = count
+            print(f"[DB] Archived {count} fixtures from {month} -> {partition_path(month, path)}")
+    return moved
+
+def _ensure_partition_schema(part_path, path=None):
+    """
+    Creates (or widens) the partitioned tables and their indexes in an archive file.
+    The DDL is copied from the hot database, so archives track its schema without running
+    the full migration chain.
+    """
+    names = [table for table, _ in PARTITIONED_TABLES]
+    marks = ", ".join("?" * len(names))
+    with db.connection(path) as conn:
+        ddl = conn.execute(
+            f"SELECT type, name, tbl_name, sql FROM sqlite_master WHERE tbl_name IN ({marks}) AND sql IS NOT NULL",
+            names
+        ).fetchall()
+        columns = {table: conn.execute(f"PRAGMA table_info({table})").fetchall() for table in names}
+
+    part = sqlite3.connect(part_path)
+    try:
+        # Archives are cold: no WAL sidecar files
+        part.execute("PRAGMA journal_mode=DELETE")
+        existing = {row[0] for row in part.execute("SELECT name FROM sqlite_master")}
+        for kind in ("table", "index"):
+            for row in ddl:
+                if row['type'] == kind and row['name'] not in existing:
+                    part.execute(row['sql'])
+        # Columns added to the hot schema after this archive was created
+        for table in names:
+            present = {row[1] for row in part.execute(f"PRAGMA table_info({table})")}
+            for col in columns[table]:
+                if col['name'] not in present:
+                    part.execute(f"ALTER TABLE {table} ADD COLUMN {col['name']} {col['type']}")
+        part.commit()
+    finally:
+        part.close()
+    return {table: [col['name'] for col in columns[table]] for table in names}
+
+def _archive_month(month, path=None):
+    part_path = partition_path(month, path)
+    os.makedirs(partition_dir(path), exist_ok=True)
+    columns = _ensure_partition_schema(part_path, path)
+
+    with db.connection(path) as conn:
+        conn.execute("ATTACH DATABASE ? AS part", (part_path,))
+        try:
+            conn.execute("DROP TABLE IF EXISTS temp.archive_ids")
+            # Only fixtures with a result and no ungraded predictions leave the hot set
+            conn.execute('''
+                CREATE TEMP TABLE archive_ids AS
+                SELECT id FROM main.matches m
+                WHERE substr(m.date, 1, 7) = ? AND m.winner IS NOT NULL
+                  AND NOT EXISTS (SELECT 1 FROM main.predictions p
+                                  WHERE p.match_id = m.id AND p.is_correct IS NULL)
+            ''', (month,))
+            count = conn.execute("SELECT COUNT(*) FROM temp.archive_ids").fetchone()[0]
+
+            if count:
+                for table, key in PARTITIONED_TABLES:
+                    cols = ", ".join(columns[table])
+                    conn.execute(
+                        f"INSERT OR REPLACE INTO part.{table} ({cols}) SELECT {cols} FROM main.{table} "
+                        f"WHERE {key} IN (SELECT id FROM temp.archive_ids)"
+                    )
+                # Under WAL a multi-database commit is atomic per file, not across files;
+                # the copy above is idempotent, so a crash here is healed by the next run.
+                for table, key in reversed(PARTITIONED_TABLES):
+                    conn.execute(f"DELETE FROM main.{table} WHERE {key} IN (SELECT id FROM temp.archive_ids)")
+            conn.execute("DROP TABLE temp.archive_ids")
+            conn.commit()
+        except Exception:
+            conn.rollback() # DETACH is not allowed inside an open transaction
+            raise
+        finally:
+            conn.execute("DETACH DATABASE part")
+    return count
+
+class PartitionRouter:
+    """
+    Runs a query over the hot database plus only the archived months its date range touches.
+
+    The SQL is written once with a `{db}` schema placeholder, e.g.
+        "SELECT p.model_name, p.is_correct FROM {db}.predictions p
+         JOIN {db}.matches m ON m.id = p.match_id WHERE m.date BETWEEN ? AND ?"
+    and is expanded into a UNION ALL across `main` and each attached partition.
+    Rows come back hot database first, then partitions in ascending month order.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+
+    def partitions_for(self, date_from=None, date_to=None):
+        months = list_partitions(self.path)
+        if date_from:
+            months = [m for m in months if m >= date_from[:7]]
+        if date_to:
+            months = [m for m in months if m <= date_to[:7]]
+        return months
+
+    def query(self, sql, params=(), date_from=None, date_to=None):
+        months = self.partitions_for(date_from, date_to)
+        conn = db.get_db_connection(self.path)
+        try:
+            rows = conn.execute(sql.format(db="main"), params).fetchall()
+
+            # Attach in batches to stay under SQLite's attached-database limit
+            for start in range(0, len(months), MAX_ATTACHED):
+                batch = months[start:start + MAX_ATTACHED]
+                aliases = []
+                for i, month in enumerate(batch):
+                    alias = f"p{i}"
+                    conn.execute("ATTACH DATABASE ? AS " + alias, (partition_uri(month, self.path),))
+                    aliases.append(alias)
+                try:
+                    union = " UNION ALL ".join(f"SELECT * FROM ({sql.format(db=alias)})" for alias in aliases)
+                    rows.extend(conn.execute(union, tuple(params) * len(aliases)).fetchall())
+                finally:
+                    for alias in aliases:
+                        conn.execute(f"DETACH DATABASE {alias}")
+            return rows
+        finally:
+            conn.close()
+
+    def stream_sorted(self, sql, params=(), key=None, date_from=None, date_to=None):
+        """
+        Streams one ORDER BY query over the hot database and each archived month as a single
+        sorted sequence (k-way merge), holding one row per source in memory. `sql` takes no
+        `{db}` placeholder: it runs unchanged on every source, each through its own
+        connection, so there is no limit on how many months take part. `key` must match the
+        query's ORDER BY.
+        """
+        conns = [db.get_db_connection(self.path)]
+        try:
+            conns.extend(open_partition(month, self.path) for month in self.partitions_for(date_from, date_to))
+            yield from heapq.merge(*(conn.execute(sql, params) for conn in conns), key=key)
+        finally:
+            for conn in conns:
+                conn.close()
@@ -1,113 +1,218 @@
-import sqlite3
-import json
 import random
-import os
-from datetime import datetime, timedelta
+from datetime import datetime
 from model_versions import ModelVersions as MV
-
-DB_NAME = "quantgoal_core.db"
-
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
+import db # Shared pooled SQLite access layer
+import partitions # Cold-history archive
+import json_export # Atomic public/*.json snapshots
 
 def settle_matches_simulated():
     """
     GOD MODE: Simulates match results for pending matches in DB
     so we can see the leaderboard update immediately.
     """
-    conn = get_db_connection()
-    c = conn.cursor()
-    
     # Find matches that look like they haven't been settled (no winner set)
     # For demo purposes, we settle EVERYTHING that is currently in the matches table
-    matches = c.execute("SELECT id, home_team, away_team FROM matches WHERE winner IS NULL").fetchall()
+    with db.connection() as conn:
+        matches = conn.execute("SELECT id, home_team, away_team FROM matches WHERE winner IS NULL").fetchall()
     
     print(f"Settling {len(matches)} pending matches (Simulated)...")
     
+    results = []
     for m in matches:
         # Simulate a score
         home_score = random.randint(0, 4)
         away_score = random.randint(0, 3)
+        print(f"  Match {m['home_team']} vs {m['away_team']} -> Result: {home_score}-{away_score}")
+        results.append((m['id'], home_score, away_score))
         
+    return ingest_results(results)
+
+def ingest_results(results):
+    """
+    Batched result ingestion: `results` is a list of (match_id, home_score, away_score).
+    All rows are written with one executemany in a single transaction.
+    Returns the number of matches updated.
+    """
+    rows = []
+    for match_id, home_score, away_score in results:
         if home_score > away_score: winner = 'Home'
         elif away_score > home_score: winner = 'Away'
         else: winner = 'Draw'
-        
-        print(f"  Match {m['home_team']} vs {m['away_team']} -> Result: {home_score}-{away_score} ({winner})")
-        
-        c.execute('''
+        rows.append((home_score, away_score, winner, str(match_id)))
+    
+    with db.connection() as conn:
+        cur = conn.executemany('''
             UPDATE matches 
             SET final_home_score = ?, final_away_score = ?, winner = ?, status = 'FT'
             WHERE id = ?
-        ''', (home_score, away_score, winner, m['id']))
-        
-    conn.commit()
-    conn.close()
+        ''', rows)
+        updated = cur.rowcount
+    
+    print(f"Ingested {updated} match results.")
+    return updated
+
+# Flat stake used for performance accounting; odds come from the stored consensus_signals
+PERF_STAKE = 100
+DEFAULT_ODDS = 1.95
 
 def grade_predictions():
-    """Checks model predictions against match results."""
-    conn = get_db_connection()
-    c = conn.cursor()
+    """
+    Checks model predictions against match results.
+    One set-based UPDATE (correlated on matches.winner) grades the whole backlog,
+    and the same transaction applies the graded batch as a delta to model_performance.
+    """
+    with db.connection() as conn:
+        # Write lock up front so the snapshot and the UPDATE see the same ungraded rows
+        conn.execute("BEGIN IMMEDIATE")
+        _snapshot_grade_batch(conn)
+        
+        cur = conn.execute('''
+            UPDATE predictions
+            SET is_correct = (
+                prediction_target = (SELECT m.winner FROM matches m WHERE m.id = predictions.match_id)
+            )
+            WHERE is_correct IS NULL
+              AND match_id IN (SELECT id FROM matches WHERE winner IS NOT NULL)
+        ''')
+        graded = cur.rowcount
+        
+        _apply_performance_delta(conn)
     
-    # Get ungraded predictions where max result is available
-    sql = '''
-        SELECT p.id, p.prediction_target, m.winner, p.model_name
+    print(f"Graded {graded} predictions.")
+    return graded
+
+def _snapshot_grade_batch(conn):
+    """Temp table of the rows about to be graded, with result and the odds actually stored."""
+    conn.execute("DROP TABLE IF EXISTS temp.grade_batch")
+    conn.execute('''
+        CREATE TEMP TABLE grade_batch AS
+        SELECT
+            p.model_name,
+            substr(m.date, 1, 10) AS day,
+            (p.prediction_target = m.winner) AS correct,
+            COALESCE(CASE p.prediction_target
+                WHEN 'Home' THEN cs.market_odds_home
+                WHEN 'Away' THEN cs.market_odds_away
+                ELSE cs.market_odds_draw
+            END, ?) AS odds
         FROM predictions p
-        JOIN matches m ON p.match_id = m.id
+        JOIN matches m ON m.id = p.match_id
+        LEFT JOIN consensus_signals cs ON cs.match_id = p.match_id
         WHERE p.is_correct IS NULL AND m.winner IS NOT NULL
-    '''
-    predictions = c.execute(sql).fetchall()
+    ''', (DEFAULT_ODDS,))
+
+def _apply_performance_delta(conn):
+    """
+    Folds the graded batch into model_performance (per model, per day), then refreshes
+    running totals only for the touched models from the earliest touched day onwards.
+    """
+    conn.execute('''
+        INSERT INTO model_performance (model_name, date, bets, wins, daily_pnl, total_pnl, strike_rate, total_bets, total_wins)
+        SELECT model_name, day, COUNT(*), SUM(correct),
+               SUM(CASE WHEN correct THEN ? * (odds - 1) ELSE -? END),
+               0, 0, 0, 0
+        FROM grade_batch
+        WHERE 1
+        GROUP BY model_name, day
+        ON CONFLICT (model_name, date) DO UPDATE SET
+            bets = bets + excluded.bets,
+            wins = wins + excluded.wins,
+            daily_pnl = daily_pnl + excluded.daily_pnl
+    ''', (PERF_STAKE, PERF_STAKE))
     
-    print(f"Grading {len(predictions)} predictions...")
+    conn.execute('''
+        UPDATE model_performance
+        SET total_pnl = (SELECT SUM(mp.daily_pnl) FROM model_performance mp
+                         WHERE mp.model_name = model_performance.model_name AND mp.date <= model_performance.date),
+            total_bets = (SELECT SUM(mp.bets) FROM model_performance mp
+                          WHERE mp.model_name = model_performance.model_name AND mp.date <= model_performance.date),
+            total_wins = (SELECT SUM(mp.wins) FROM model_performance mp
+                          WHERE mp.model_name = model_performance.model_name AND mp.date <= model_performance.date)
+        WHERE EXISTS (SELECT 1 FROM grade_batch g
+                      WHERE g.model_name = model_performance.model_name AND g.day <= model_performance.date)
+    ''')
+    conn.execute('''
+        UPDATE model_performance SET strike_rate = ROUND(total_wins * 100.0 / total_bets, 1)
+        WHERE total_bets > 0 AND model_name IN (SELECT model_name FROM grade_batch)
+    ''')
+    conn.execute("DROP TABLE temp.grade_batch")
+
+def build_history_curve(conn, series, days=30, end_date=None):
+    """
+    Cumulative daily PnL per model over the last `days` days, from ONE window-function query
+    over model_performance (graded picks at their stored odds, keyed by (model_name, date)).
+    Days without graded bets carry the previous value forward.
+
+    series: {model_name in DB: key in the exported JSON}
+    Returns rows in the league_history.json shape: [{"day": "MM-DD", key: cum_pnl_units, ...}]
+    """
+    end_date = end_date or datetime.now().strftime('%Y-%m-%d')
+    model_names = list(series)
+    model_values = ", ".join("(?)" for _ in model_names)
     
-    for p in predictions:
-        is_correct = (p['prediction_target'] == p['winner'])
-        c.execute("UPDATE predictions SET is_correct = ? WHERE id = ?", (is_correct, p['id']))
-        
-    conn.commit()
-    conn.close()
+    rows = conn.execute('''
+        WITH RECURSIVE days(day) AS (
+            SELECT date(?, ?)
+            UNION ALL
+            SELECT date(day, '+1 day') FROM days WHERE day < date(?)
+        ),
+        models(model_name) AS (VALUES MODEL_VALUES)
+        SELECT
+            d.day,
+            mo.model_name,
+            SUM(COALESCE(mp.daily_pnl, 0)) OVER (
+                PARTITION BY mo.model_name ORDER BY d.day
+            ) AS cum_pnl
+        FROM days d
+        CROSS JOIN models mo
+        LEFT JOIN model_performance mp ON mp.model_name = mo.model_name AND mp.date = d.day
+        ORDER BY d.day
+    '''.replace("MODEL_VALUES", model_values), (end_date, f"-{days - 1} days", end_date, *model_names)).fetchall()
+    
+    history = []
+    by_day = {}
+    for r in rows:
+        if r['day'] not in by_day:
+            by_day[r['day']] = {"day": datetime.strptime(r['day'], '%Y-%m-%d').strftime("%m-%d")}
+            history.append(by_day[r['day']])
+        by_day[r['day']][series[r['model_name']]] = round(r['cum_pnl'] / PERF_STAKE, 1)
+    return history
 
-def update_leaderboard_json():
+def update_leaderboard_json(history_days=30):
     """
     Aggregates performance from DB and generates the JSON files 
     expected by the Frontend (AlphaLeagueWidget).
     """
-    conn = get_db_connection()
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
     # 1. Calculate Stats Per Model
     models = [MV.DEEPSEEK, MV.CLAUDE, MV.CHATGPT, MV.QWEN, MV.GROK, MV.GEMINI]
     leaderboard = []
     
-    for model in models:
-        stats = c.execute('''
-            SELECT 
-                COUNT(*) as total_bets,
-                SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) as wins
-            FROM predictions 
-            WHERE model_name = ? AND is_correct IS NOT NULL
-        ''', (model,)).fetchone()
-        
-        total = stats['total_bets'] or 0
+    # Latest running totals per model from the maintained view: O(models), not O(history)
+    with db.connection() as conn:
+        model_stats = [conn.execute('''
+            SELECT total_bets, total_wins AS wins, total_pnl
+            FROM model_performance
+            WHERE model_name = ?
+            ORDER BY date DESC
+            LIMIT 1
+        ''', (model,)).fetchone() for model in models]
+    
+    for model, stats in zip(models, model_stats):
+        total = stats['total_bets'] if stats else 0
         
         # Fallback for Demo if no history in DB yet
-        if total == 0:
+        if not total:
             total = random.randint(40, 80)
             wins = int(total * random.uniform(0.45, 0.65))
+            # Demo PnL assumes avg odds 1.95, flat $100 bet
+            net_profit = (wins * 95) - ((total - wins) * 100)
         else:
             wins = stats['wins'] or 0
+            # Realised PnL at the actual stored odds, flat $100 bet
+            net_profit = stats['total_pnl'] or 0
             
         strike_rate = int((wins / total * 100))
-        
-        # Simulate PnL logic (assuming avg odds 1.95 for simplicity, flat $100 bet)
-        # In real Pro version, we would use the actual stored odds for that match
-        # Profit = (Wins * $100 * 0.95) - (Losses * $100)
-        losses = total - wins
-        net_profit = (wins * 95) - (losses * 100) 
-        roi = round((net_profit / (total * 100)) * 100, 1) if total > 0 else 0
+        roi = round((net_profit / (total * PERF_STAKE)) * 100, 1) if total > 0 else 0
         
         # Risk Profile Logic
         risk = "Med"
@@ -126,37 +231,20 @@ def update_leaderboard_json():
     # Sort by ROI
     leaderboard.sort(key=lambda x: x['roi_monthly'], reverse=True)
     
-    # 2. Generate History Curve (Mocking a 30-day curve ending at current PnL)
-    # In prod, this would aggregate daily realized PnL from the DB
-    history = []
-    days = 30
-    
-    for i in range(days):
-        day_label = (datetime.now() - timedelta(days=days-i)).strftime("%m-%d")
-        point = {"day": day_label}
-        
-        for model in models:
-            # Generate a random walk that ends roughly near the calculated ROI (simulated consistency)
-            # This is just for visualization smoothing until we have 30 days of real DB data
-            random_variance = random.uniform(-5, 5)
-            point[model] = round(random_variance + (i * 2), 1) # Trending up
-            
-        point["Consensus"] = round(i * 2.5 + random.uniform(-2, 2), 1) # Consensus usually steady
-        history.append(point)
+    # 2. Generate History Curve (cumulative realised PnL per model, in stake units)
+    series = {model: model for model in models}
+    series[db.CONSENSUS_MODEL_NAME] = "Consensus"
+    with db.connection() as conn:
+        history = build_history_curve(conn, series, history_days)
 
-    # WRITE FILES
-    public_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'public')
-    
-    with open(os.path.join(public_dir, 'league_leaderboard.json'), 'w') as f:
-        json.dump(leaderboard, f, indent=2)
-        
-    with open(os.path.join(public_dir, 'league_history.json'), 'w') as f:
-        json.dump(history, f, indent=2)
+    # WRITE FILES (atomic replace, so the frontend never reads a partial file)
+    json_export.write_json(json_export.public_path('league_leaderboard.json'), leaderboard)
+    json_export.write_json(json_export.public_path('league_history.json'), history)
         
     print(f"Leaderboard updated. Top Model: {leaderboard[0]['name']} (${leaderboard[0]['roi_monthly']}%)")
-    conn.close()
 
 if __name__ == "__main__":
     settle_matches_simulated()
     grade_predictions()
     update_leaderboard_json()
+    partitions.archive_cold_partitions()
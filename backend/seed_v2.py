@@ -1,4 +1,3 @@
-import json
 import random
 from datetime import datetime
 import sys
@@ -8,6 +7,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from backend.model_versions import ModelVersions as MV
+from backend import json_export
 from backend.framework.prediction_engine import MultiDimensionalPredictionEngine
 # from backend.framework.portfolio_engine import PortfolioOptimizationEngine # Future
 
@@ -26,60 +26,56 @@ def seed_complete_framework():
         {"home": "PSG", "away": "Marseille", "league": "Ligue 1", "odds_h": 1.45, "odds_d": 4.80, "odds_a": 6.00}
     ]
     
-    generated_matches = []
-    
-    for idx, m in enumerate(match_list):
-        match_id = f"match_v2_{idx+1:03d}"
+    # Each match is streamed to file as soon as it is generated
+    output_path = json_export.public_path('matches_data.json')
+    with json_export.JsonArrayWriter(output_path, pretty=True) as out:
+        for idx, m in enumerate(match_list):
+            match_id = f"match_v2_{idx+1:03d}"
         
-        # Base Match Info
-        match_data = {
-            "id": match_id,
-            "match_info": {
-                "home_team": m["home"],
-                "away_team": m["away"],
-                "league": m["league"],
-                "date": datetime.now().isoformat(),
-                "status": "Scheduled"
-            },
-            "market_odds": {
-                "1x2": {"home": m["odds_h"], "draw": m["odds_d"], "away": m["odds_a"]}
-            },
-            "model_predictions": {} # New Structure: Keyed by Model ID
-        }
+            # Base Match Info
+            match_data = {
+                "id": match_id,
+                "match_info": {
+                    "home_team": m["home"],
+                    "away_team": m["away"],
+                    "league": m["league"],
+                    "date": datetime.now().isoformat(),
+                    "status": "Scheduled"
+                },
+                "market_odds": {
+                    "1x2": {"home": m["odds_h"], "draw": m["odds_d"], "away": m["odds_a"]}
+                },
+                "model_predictions": {} # New Structure: Keyed by Model ID
+            }
         
-        # Generate Multi-Dimensional Predictions for EACH model
-        debate_scripts = [] # Legacy format for chat compatibility
+            # Generate Multi-Dimensional Predictions for EACH model
+            debate_scripts = [] # Legacy format for chat compatibility
         
-        for model_id in models:
-            engine = MultiDimensionalPredictionEngine(model_id)
-            preds = engine.predict_match(m) # Passing simple match dict for now
+            for model_id in models:
+                engine = MultiDimensionalPredictionEngine(model_id)
+                preds = engine.predict_match(m) # Passing simple match dict for now
             
-            # Save structured prediction
-            match_data["model_predictions"][model_id] = preds
+                # Save structured prediction
+                match_data["model_predictions"][model_id] = preds
             
-            # Generate Legacy "Script" logic string based on these preds
-            # This ensures Chat "Persona" aligns with "Data"
-            logic_text = _generate_logic_text(model_id, preds, m)
+                # Generate Legacy "Script" logic string based on these preds
+                # This ensures Chat "Persona" aligns with "Data"
+                logic_text = _generate_logic_text(model_id, preds, m)
             
-            debate_scripts.append({
-                "model": model_id,
-                "confidence": preds['statistical']['confidence'],
-                "logic": logic_text
-            })
+                debate_scripts.append({
+                    "model": model_id,
+                    "confidence": preds['statistical']['confidence'],
+                    "logic": logic_text
+                })
             
-        match_data["models"] = debate_scripts # For frontend chat compatibility
-        
-        # Generate Consensus (Weighted Average of Models)
-        match_data["consensus"] = _calculate_consensus(match_data["model_predictions"])
+            match_data["models"] = debate_scripts # For frontend chat compatibility
         
-        generated_matches.append(match_data)
+            # Generate Consensus (Weighted Average of Models)
+            match_data["consensus"] = _calculate_consensus(match_data["model_predictions"])
         
-    # Write to File
-    output_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'public', 'matches_data.json')
-    with open(output_path, 'w') as f:
-        json.dump(generated_matches, f, indent=2)
+            out.write(match_data)
         
-    print(f"Seeded {len(generated_matches)} matches with Multi-Dimensional Data to {output_path}")
+    print(f"Seeded {out.count} matches with Multi-Dimensional Data to {output_path}")
 
 def _generate_logic_text(model_name, preds, match_info):
     """Generates the 'Chat' logic string consistent with the prediction data."""
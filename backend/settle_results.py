@@ -1,8 +1,16 @@
 import os
+import re
 import json
+import unicodedata
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 from supabase import create_client, Client
+from framework import settlement_kernel
+import db
+import migrations
+import decision_ledger
 
 # Load Env
 load_dotenv(dotenv_path='backend/.env')
@@ -16,186 +24,447 @@ if not url or not key:
 
 supabase: Client = create_client(url, key)
 ODDS_API_KEY = os.getenv('ODDS_API_KEY')
+UPSERT_CHUNK_SIZE = 500
+PAGE_SIZE = 1000 # Supabase default max rows per select
+# Columns settle_bet / poll_scores read (supabase_schema.sql)
+PENDING_COLUMNS = {
+    'parlay_tickets': 'id, date, legs, total_odds, stake, created_at',
+    'user_bets': 'id, selection_details, stake, created_at',
+}
+SCORE_POLL_WORKERS = 5
+MAX_DAYS_FROM = 3 # Odds API scores window limit
+UNKNOWN_TEAM_RETRY = timedelta(days=1) # League-less legs of unknown teams re-poll every league at most this often
 
-def get_scores(sport="soccer_epl"):
+# Leagues fetch_real_slate produces signals for
+SPORT_KEYS = ['soccer_epl', 'soccer_spain_la_liga', 'soccer_germany_bundesliga', 'soccer_italy_serie_a', 'soccer_france_ligue_one']
+LEAGUE_SPORT_KEYS = {
+    "Premier League": "soccer_epl",
+    "La Liga": "soccer_spain_la_liga",
+    "Bundesliga": "soccer_germany_bundesliga",
+    "Serie A": "soccer_italy_serie_a",
+    "Ligue 1": "soccer_france_ligue_one",
+}
+LEAGUE_SPORT_KEYS.update({sport: sport for sport in SPORT_KEYS})
+
+def get_scores(sport="soccer_epl", days_from=3):
     """
-    Fetch scores from The-Odds-API.
+    Fetch scores from The-Odds-API for one sport.
+    days_from=None returns live and upcoming events only (half the quota cost).
     """
     if not ODDS_API_KEY:
         print("Warning: ODDS_API_KEY not found. Using simulation/mock logic if needed.")
         return []
     
-    url = f"https://api.the-odds-api.com/v4/sports/{sport}/scores/?apiKey={ODDS_API_KEY}&daysFrom=3"
+    url = f"https://api.the-odds-api.com/v4/sports/{sport}/scores/?apiKey={ODDS_API_KEY}"
+    if days_from:
+        url += f"&daysFrom={days_from}"
     try:
-        response = requests.get(url)
+        response = requests.get(url, timeout=10)
         if response.status_code == 200:
             return response.json()
         else:
-            print(f"Error fetching scores: {response.status_code}")
+            print(f"Error fetching scores ({sport}): {response.status_code}")
             return []
     except Exception as e:
-        print(f"Exception fetching scores: {e}")
+        print(f"Exception fetching scores ({sport}): {e}")
         return []
 
-def check_win(match_score, prediction, home_team, away_team):
+def poll_scores(pending_bets):
     """
-    Determine if a selection won based on match score.
-    Returns (won: bool, pnl_factor: float)
+    Incremental, exposure-driven score polling.
+
+    1. Completed events already recorded locally are served from quantgoal_core.db.
+    2. Legs they do not resolve are grouped by league; only those leagues are polled,
+       concurrently, with the smallest daysFrom window covering their oldest kickoff.
+       Legs without a league use the team -> league map learned from earlier polls.
+    3. Newly completed events (and the leagues of every team seen) are recorded so they
+       are never fetched again.
+
+    Returns the event list for build_score_index / settle_bets.
+    """
+    now = datetime.now(timezone.utc)
+    placed = [day for day in (str(b.get('date') or b.get('created_at') or '')[:10] for b in pending_bets) if day]
+    # Nothing pending can have kicked off before the oldest open bet was placed
+    since = min(placed) if placed else (now - timedelta(days=MAX_DAYS_FROM)).date().isoformat()
+    known = _load_completed_events(since)
+    index = build_score_index(known)
+    team_sports = _load_team_sports()
+
+    windows = {} # sport -> days_from (None = live / upcoming only)
+    searched = set() # teams of league-less legs that need every league polled
+    for bet in pending_bets:
+        placed_on = bet.get('date') or bet.get('created_at')
+        for leg in bet.get('selection_details') or bet.get('legs') or []:
+            match_str = leg.get('match') or leg.get('fullMatch')
+            teams = _parse_match(match_str) if match_str else None
+            if teams is None:
+                continue
+            kickoff = leg.get('commence_time') or leg.get('date')
+            if resolve_score(index, teams[0], teams[1], kickoff, placed_on) is not None:
+                continue
+            days_from = _days_from(kickoff or str(placed_on or '')[:10], now)
+            sports = _leg_sports(leg, bet, teams, team_sports, now)
+            if sports is SPORT_KEYS:
+                searched.update(normalize_team(team) for team in teams)
+            for sport in sports:
+                if sport not in windows or _wider(days_from, windows[sport]):
+                    windows[sport] = days_from
+
+    if not windows:
+        return known
+
+    print(f"Polling scores for {len(windows)} league(s): {windows}")
+    with ThreadPoolExecutor(max_workers=min(len(windows), SCORE_POLL_WORKERS)) as pool:
+        fetched = dict(zip(windows, pool.map(lambda sport: get_scores(sport, windows[sport]), windows)))
+
+    events = list(known)
+    completed = []
+    learned = {}
+    for sport, sport_events in fetched.items():
+        for event in sport_events:
+            events.append(event)
+            learned[normalize_team(event.get('home_team'))] = sport
+            learned[normalize_team(event.get('away_team'))] = sport
+            if event.get('completed') and event.get('scores'):
+                completed.append((sport, event))
+    _record_completed_events(completed)
+    # Teams missing from a full, successful poll of every league are outside coverage for now
+    if searched and all(fetched.get(sport) for sport in SPORT_KEYS):
+        learned.update({team: None for team in searched if team not in learned})
+    _record_team_sports(learned, now)
+    return events
+
+def _leg_sports(leg, bet, teams, team_sports, now):
+    """Leagues to poll for an unresolved leg: its own, the one its teams were last seen in, or all."""
+    sport = leg.get('sport_key') or bet.get('sport_key') or LEAGUE_SPORT_KEYS.get(leg.get('league') or bet.get('league'))
+    if sport:
+        return [sport]
+    seen = [team_sports.get(normalize_team(team)) for team in teams]
+    for entry in seen:
+        if entry and entry[0]:
+            return [entry[0]]
+    if all(entry and now - entry[1] < UNKNOWN_TEAM_RETRY for entry in seen):
+        return [] # Searched every league recently without finding either team
+    return SPORT_KEYS # League unknown: any covered league may hold the fixture
+
+def _days_from(kickoff, now):
+    """
+    Smallest daysFrom (1-3) reaching back to a fixture whose kickoff has passed, same-day
+    fixtures included (completed games drop out of the live/upcoming feed). None only when
+    the fixture has not started yet; 3 when the date is unknown.
+    """
+    if not kickoff:
+        return MAX_DAYS_FROM
+    text = str(kickoff)
+    try:
+        if len(text) > 10:
+            start = datetime.fromisoformat(text.replace('Z', '+00:00'))
+            if (start if start.tzinfo else start.replace(tzinfo=timezone.utc)) > now:
+                return None
+        day = datetime.fromisoformat(text[:10]).date()
+    except ValueError:
+        return MAX_DAYS_FROM
+    if day > now.date():
+        return None
+    return min(max((now.date() - day).days, 1), MAX_DAYS_FROM)
+
+def _wider(days_from, current):
+    return (days_from or 0) > (current or 0)
+
+def _load_completed_events(since):
+    with db.connection() as conn:
+        migrations.migrate(conn)
+        rows = conn.execute(
+            "SELECT payload FROM completed_events WHERE commence_time >= ?", (since,)
+        ).fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+def _load_team_sports():
+    """team_key -> (sport_key or None, seen_at datetime)."""
+    with db.connection() as conn:
+        migrations.migrate(conn)
+        rows = conn.execute("SELECT team_key, sport_key, seen_at FROM team_sports").fetchall()
+    return {row[0]: (row[1], datetime.fromisoformat(row[2])) for row in rows}
+
+def _record_team_sports(team_sports, now):
+    if not team_sports:
+        return
+    with db.connection() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO team_sports (team_key, sport_key, seen_at) VALUES (?, ?, ?)",
+            [(team, sport, now.isoformat()) for team, sport in team_sports.items() if team]
+        )
+
+def _record_completed_events(completed):
+    if not completed:
+        return
+    now = datetime.now().isoformat()
+    with db.connection() as conn:
+        conn.executemany('''
+            INSERT OR IGNORE INTO completed_events (event_id, sport_key, home_team, away_team, commence_time, payload, recorded_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (e.get('id'), sport, e.get('home_team'), e.get('away_team'), e.get('commence_time'), json.dumps(e), now)
+            for sport, e in completed
+        ])
+
+def leg_outcome(match_score, prediction, home_team, away_team):
+    """
+    settlement_kernel OUTCOME_* code of a selection against a match score (win, half-win,
+    push, half-loss, loss), or None while the match is not finished. Unparseable
+    selections settle as a loss.
     """
     if not match_score or not match_score.get('completed'):
-        return None, 0 # Not finished
+        return None # Not finished
     
     scores = match_score.get('scores', [])
-    if not scores: return None, 0
+    if not scores: return None
 
-    h_score = int(next((x['score'] for x in scores if x['name'] == home_team), 0))
-    a_score = int(next((x['score'] for x in scores if x['name'] == away_team), 0))
-    
-    won = False
-    pnl_factor = 1.0
-
-    if prediction == home_team or prediction == "Home Win":
-        won = (h_score > a_score)
-    elif prediction == away_team or prediction == "Away Win":
-        won = (a_score > h_score)
-    elif prediction == "Draw":
-        won = (h_score == a_score)
-    elif "Over" in prediction:
-        try:
-            line = float(prediction.split()[-1])
-            won = (h_score + a_score > line)
-        except: pass
-    elif "Under" in prediction:
-        try:
-            line = float(prediction.split()[-1])
-            won = (h_score + a_score < line)
-        except: pass
-    
-    # Add other logic (Asian Handicap) if needed, simplified for now
-    
-    return won, pnl_factor
+    # Scores are keyed by the API's own team names, which may differ from the leg's spelling
+    event_home = match_score.get('home_team', home_team)
+    event_away = match_score.get('away_team', away_team)
+    h_score = int(next((x['score'] for x in scores if x['name'] == event_home), 0))
+    a_score = int(next((x['score'] for x in scores if x['name'] == event_away), 0))
+
+    parsed = settlement_kernel.parse_selection(prediction, home_team, away_team)
+    if parsed is None:
+        return settlement_kernel.OUTCOME_LOSS
+
+    market, line, selection = parsed
+    return int(settlement_kernel.outcomes([h_score], [a_score], [market], [line], [selection])[0])
+
+def normalize_team(name):
+    """Canonical team key: case-, accent-, punctuation- and whitespace-insensitive."""
+    text = unicodedata.normalize('NFKD', str(name or '')).encode('ascii', 'ignore').decode('ascii')
+    return " ".join(re.sub(r'[^a-z0-9]+', ' ', text.lower()).split())
+
+def build_score_index(scores_list):
+    """
+    One pass over the API scores: (home, away, commence date) -> event, plus
+    (home, away) -> events sorted by kickoff for legs that carry no date.
+    """
+    by_date = {}
+    by_pair = {}
+    for event in scores_list:
+        pair = (normalize_team(event.get('home_team')), normalize_team(event.get('away_team')))
+        day = (event.get('commence_time') or '')[:10]
+        by_date[pair + (day,)] = event
+        by_pair.setdefault(pair, []).append((day, event))
+    for events in by_pair.values():
+        events.sort(key=lambda item: item[0])
+    return {"by_date": by_date, "by_pair": by_pair}
 
-def settle_bets(table_name, scores_list):
+def resolve_score(index, home_team, away_team, date=None, placed_on=None):
     """
-    Generic settlement for 'user_bets' or 'parlay_tickets'
+    O(1) lookup of a leg's event. Without a kickoff date, takes the first event on/after
+    placement (None if the pair has only met before the bet was placed); only when the
+    placement date is unknown too does it fall back to the pair's latest meeting.
+    """
+    pair = (normalize_team(home_team), normalize_team(away_team))
+    if date:
+        return index['by_date'].get(pair + (str(date)[:10],))
+    events = index['by_pair'].get(pair)
+    if not events:
+        return None
+    if placed_on:
+        day = str(placed_on)[:10]
+        for event_day, event in events:
+            if event_day >= day:
+                return event
+        return None
+    return events[-1][1]
+
+def _parse_match(match_str):
+    # Clean up "Combo: " prefix if present
+    teams = match_str.replace("Combo: ", "").split(" vs ")
+    if len(teams) < 2:
+        return None
+    return teams[0].strip(), teams[1].strip()
+
+def settle_bet(bet, index):
+    """Outcome of one bet against the score index: (status, pnl), or None while legs are open."""
+    legs = bet.get('selection_details') or bet.get('legs') # handle both schemas
+    if not legs:
+        return None
+    placed_on = bet.get('date') or bet.get('created_at')
+
+    leg_outcomes = []
+    leg_odds = []
+    all_settled = True
+    for leg in legs:
+        # Parse Teams from string "Team A vs Team B" or leg['match']
+        match_str = leg.get('match') or leg.get('fullMatch')
+        teams = _parse_match(match_str) if match_str else None
+        if teams is None:
+            all_settled = False
+            continue
+        home_team, away_team = teams
+
+        match_score = resolve_score(index, home_team, away_team, leg.get('commence_time') or leg.get('date'), placed_on)
+        selection = leg.get('selection') or leg.get('team')
+        outcome = leg_outcome(match_score, selection, home_team, away_team)
+
+        if outcome is None: # Match not finished
+            all_settled = False
+            continue
+        if outcome == settlement_kernel.OUTCOME_LOSS:
+            # Any losing leg settles the whole ticket
+            return "LOST", -float(bet.get('stake', 0))
+        leg_outcomes.append(outcome)
+        leg_odds.append(leg.get('odds'))
+
+    if not all_settled:
+        return None
+
+    stake = float(bet.get('stake', 0))
+    # Legs carrying their own odds settle exactly; the rest share the ticket's total_odds
+    payout_factor = settlement_kernel.ticket_payout_factor(leg_outcomes, leg_odds, bet.get('total_odds'))
+    if payout_factor is None:
+        print(f"Bet {bet.get('id')}: winning leg has no odds and no total_odds; left PENDING.")
+        return None
+
+    pnl = stake * payout_factor - stake
+    if payout_factor > 1:
+        return "WON", pnl
+    if payout_factor == 1:
+        return "VOID", pnl
+    return "LOST", pnl
+
+def fetch_pending(table_name):
+    """
+    Every PENDING row of `table_name`, projected to the columns settlement reads.
+    Pages continue from the last (created_at, id) seen, like settlement_engine's ticket sync.
+    """
+    rows = []
+    cursor = None
+    while True:
+        query = supabase.table(table_name).select(PENDING_COLUMNS[table_name]).eq('status', 'PENDING')
+        if cursor:
+            created_at, bet_id = cursor
+            query = query.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{bet_id})')
+        page = query.order('created_at').order('id').limit(PAGE_SIZE).execute().data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        cursor = (page[-1]['created_at'], page[-1]['id'])
+
+def settle_bets(table_name, scores_list, pending_bets=None, ref=None):
+    """
+    Generic settlement for 'user_bets' or 'parlay_tickets'.
+    Scores are indexed once, every pending bet is resolved against the index, and results
+    are written back through settle_pending_bets (payments_schema.sql), which only flips
+    bets that are still PENDING. user_bets go in ONE call per run: the winners' payouts
+    (stake + profit, summed per user) are paid by a single bulk_credit_users under `ref` in
+    the same transaction. parlay_tickets carry no payouts and are written in chunks.
+    Returns the ids settled.
     """
     print(f"Checking {table_name}...")
     
     # 1. Fetch Pending
-    res = supabase.table(table_name).select('*').eq('status', 'PENDING').execute()
-    pending_bets = res.data
+    if pending_bets is None:
+        pending_bets = fetch_pending(table_name)
     
     if not pending_bets:
         print(f"No pending bets in {table_name}.")
-        return
+        return []
+
+    index = build_score_index(scores_list)
+    results = []
 
     for bet in pending_bets:
-        legs = bet.get('selection_details') or bet.get('legs') # handle both schemas
-        if not legs: continue
-        
-        all_won = True
-        any_lost = False
-        all_settled = True
-        
-        # Iterate legs
-        for leg in legs:
-            # Parse Teams from string "Team A vs Team B" or leg['match']
-            match_str = leg.get('match') or leg.get('fullMatch')
-            if not match_str: 
-                all_settled = False
-                continue
-            
-            try:
-                # Clean up "Combo: " prefix if present
-                clean_match = match_str.replace("Combo: ", "")
-                teams = clean_match.split(" vs ")
-                if len(teams) < 2: 
-                    all_settled = False
-                    continue
-                home_team, away_team = teams[0].strip(), teams[1].strip()
-            except:
-                all_settled = False
-                continue
+        outcome = settle_bet(bet, index)
+        if outcome is None:
+            continue
+        new_status, pnl = outcome
+        print(f"Settling ID {bet['id']} as {new_status} (PnL: {pnl})")
+        results.append({"id": bet['id'], "status": new_status, "pnl": pnl})
+
+    # 2. Bulk write results + payouts (bets settled elsewhere in the meantime are skipped)
+    chunk_size = len(results) if table_name == 'user_bets' else UPSERT_CHUNK_SIZE
+    settled_ids = []
+    for start in range(0, len(results), chunk_size or 1):
+        res = supabase.rpc('settle_pending_bets', {
+            'p_table': table_name,
+            'p_results': results[start:start + chunk_size],
+            'p_ref': ref
+        }).execute()
+        settled_ids.extend(_returned_ids(res.data))
+
+    skipped = len(results) - len(settled_ids)
+    print(f"Settled {len(settled_ids)} of {len(pending_bets)} pending bets in {table_name}"
+          + (f" ({skipped} already settled elsewhere)." if skipped else "."))
+    return settled_ids
+
+def _returned_ids(data):
+    """Ids from a `returns setof uuid` RPC (plain values or single-key rows)."""
+    return [next(iter(row.values())) if isinstance(row, dict) else row for row in data or []]
 
-            # Find Score
-            match_score = None
-            for s in scores_list:
-                if s['home_team'] == home_team and s['away_team'] == away_team:
-                    match_score = s
-                    break
-            
-            selection = leg.get('selection') or leg.get('team')
-            won, factor = check_win(match_score, selection, home_team, away_team)
-            
-            if won is None: # Match not finished
-                all_settled = False
-                break # Stop processing this bet
-            
-            if not won:
-                any_lost = True
-        
-        # Determine Bet Outcome
-        new_status = None
-        pnl = 0
-        stake = float(bet.get('stake', 0))
-        
-        if any_lost:
-            new_status = "LOST"
-            pnl = -stake
-        elif all_settled and all_won:
-            new_status = "WON"
-            # Calculate Odds
-            # If total_odds stored
-            total_odds = float(bet.get('total_odds', 0))
-            if total_odds == 0: 
-                # Recalculate? Or fallback
-                legs_odds = [float(l.get('odds', 1)) for l in legs]
-                import math
-                total_odds = math.prod(legs_odds)
-            
-            payout = stake * total_odds
-            pnl = payout - stake
-        
-        # Update DB
-        if new_status:
-            print(f"Settling ID {bet['id']} as {new_status} (PnL: {pnl})")
-            
-            supabase.table(table_name).update({
-                'status': new_status,
-                'pnl': pnl
-            }).eq('id', bet['id']).execute()
-            
-            # If User Bet and Won, Credit Balance
-            if table_name == 'user_bets' and new_status == 'WON':
-                user_id = bet.get('user_id')
-                if user_id:
-                    update_balance(user_id, pnl + stake) # Return Stake + Profit? Or just PnL adjustment?
-                    # Balance usually holds Cash. So we perform Payout (Stake + Valid PnL)
-                    # Use payout logic
-
-def update_balance(user_id, amount):
-    """
-    Credits user balance.
+# Decision ledger status per settlement_kernel outcome code
+LEDGER_RESULTS = {
+    settlement_kernel.OUTCOME_WIN: "WON",
+    settlement_kernel.OUTCOME_HALF_WIN: "HALF_WON",
+    settlement_kernel.OUTCOME_PUSH: "VOID",
+    settlement_kernel.OUTCOME_HALF_LOSS: "HALF_LOST",
+    settlement_kernel.OUTCOME_LOSS: "LOST"
+}
+
+def _pending_ledger_decisions():
+    """Open PREDICTION entries of the decision ledger, grouped by match (oldest first)."""
+    by_match = {}
+    for entry in decision_ledger.query(status="PENDING", entry_type="PREDICTION"):
+        by_match.setdefault(entry.get('match'), []).append(entry)
+    return by_match
+
+def ledger_exposure(pending_decisions=None):
+    """Matches with open ledger decisions as pseudo-bets, so poll_scores also covers them."""
+    if pending_decisions is None:
+        pending_decisions = _pending_ledger_decisions()
+    return [{"date": entries[0].get('timestamp'), "legs": [{"match": match}]}
+            for match, entries in pending_decisions.items() if match]
+
+def settle_ledger_decisions(scores_list, pending_decisions=None):
     """
-    try:
-        # Get current
-        res = supabase.table('profiles').select('balance').eq('id', user_id).single().execute()
-        if res.data:
-            current = float(res.data['balance'] or 0)
-            new_bal = current + amount
-            supabase.table('profiles').update({'balance': new_bal}).eq('id', user_id).execute()
-            print(f"Credited User {user_id}: +{amount}")
-    except Exception as e:
-        print(f"Failed to update balance for {user_id}: {e}")
+    Settles open model decisions in the decision ledger against completed scores,
+    one SETTLEMENT entry per (model, match). PnL is per unit staked (None without odds).
+    Returns the number of settlement entries written.
+    """
+    if pending_decisions is None:
+        pending_decisions = _pending_ledger_decisions()
+    index = build_score_index(scores_list)
+    settled = 0
+    for match, entries in pending_decisions.items():
+        teams = _parse_match(match or '')
+        if teams is None:
+            continue
+        home_team, away_team = teams
+        results = {}
+        for entry in entries:
+            event = resolve_score(index, home_team, away_team, placed_on=entry.get('timestamp'))
+            outcome = leg_outcome(event, entry.get('selection'), home_team, away_team)
+            if outcome is None:
+                continue
+            odds = float(entry.get('odds') or 0)
+            pnl = round(float(settlement_kernel.payout_factor(outcome, odds)) - 1, 4) if odds else None
+            results[entry['model']] = (LEDGER_RESULTS[outcome], pnl)
+        if results:
+            settled += decision_ledger.settle_match(match, results)
+    if settled:
+        print(f"Decision ledger: settled {settled} model decisions.")
+    return settled
 
 if __name__ == "__main__":
     print("Running Real Settlement Engine...")
-    scores = get_scores()
+    pending = {table: fetch_pending(table) for table in ('parlay_tickets', 'user_bets')}
+    decisions = _pending_ledger_decisions()
+    scores = poll_scores(pending['parlay_tickets'] + pending['user_bets'] + ledger_exposure(decisions))
     
     # Settle System Tickets (for Feed)
-    settle_bets('parlay_tickets', scores)
+    settle_bets('parlay_tickets', scores, pending['parlay_tickets'])
     
-    # Settle User Bets (for Wallet)
-    settle_bets('user_bets', scores)
+    # Settle User Bets (for Wallet); winners are paid in the same transaction, once per run ref
+    settle_bets('user_bets', scores, pending['user_bets'], ref=f"settlement_{datetime.now().strftime('%Y%m%dT%H%M%S')}")
+
+    # Model decisions (transparency ledger)
+    settle_ledger_decisions(scores, decisions)
     
     print("Done.")
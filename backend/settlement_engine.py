@@ -3,6 +3,10 @@ import os
 import dotenv
 from datetime import datetime
 from supabase import create_client, Client
+from framework import settlement_kernel
+import db
+import migrations
+import settle_results
 
 # Load Environment Variables
 env_path = os.path.join(os.path.dirname(__file__), '.env')
@@ -12,86 +16,223 @@ url: str = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
 key: str = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 supabase: Client = create_client(url, key)
 
-def check_match_result(match_name, selection):
+PAGE_SIZE = 1000 # Supabase default max rows per select
+ID_FILTER_CHUNK_SIZE = 150 # UUIDs per .in_() filter: keeps the GET URL well under server limits (~37 chars each)
+UPSERT_CHUNK_SIZE = 500
+INDEX_WATERMARK = "parlay_tickets.created_at"
+
+# Leg result labels stored in parlay_tickets.legs <-> settlement_kernel outcome codes
+LEG_RESULTS = {
+    settlement_kernel.OUTCOME_WIN: 'Won',
+    settlement_kernel.OUTCOME_HALF_WIN: 'Half Won',
+    settlement_kernel.OUTCOME_PUSH: 'Void',
+    settlement_kernel.OUTCOME_HALF_LOSS: 'Half Lost',
+    settlement_kernel.OUTCOME_LOSS: 'Lost'
+}
+LEG_OUTCOMES = {result: code for code, result in LEG_RESULTS.items()}
+
+def match_key(home_team, away_team):
+    return f"{settle_results.normalize_team(home_team)}|{settle_results.normalize_team(away_team)}"
+
+def sync_ticket_index():
     """
-    Mocking Result Check for V2 Prototype.
-    In V3, this will query The-Odds-Api v4/sports/soccer/scores endpoint.
+    Adds legs of PENDING tickets created since the last run to the inverted index
+    (match_key -> ticket, leg position). Cost is proportional to NEW tickets only.
+    Pages continue from the last (created_at, id) seen, so any number of tickets sharing
+    one created_at is walked through in full.
     """
-    return "Pending"
+    with db.connection() as conn:
+        migrations.migrate(conn)
+        row = conn.execute("SELECT value FROM sync_state WHERE name = ?", (INDEX_WATERMARK,)).fetchone()
+    watermark = _parse_watermark(row['value']) if row else None
+
+    indexed = 0
+    cursor = watermark
+    while True:
+        query = supabase.table('parlay_tickets').select('id, date, legs, created_at').eq('status', 'PENDING')
+        if cursor:
+            created_at, ticket_id = cursor
+            if ticket_id is None:
+                # Legacy created_at-only watermark: gte + INSERT OR IGNORE re-reads its ties safely
+                query = query.gte('created_at', created_at)
+            else:
+                query = query.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{ticket_id})')
+        page = query.order('created_at').order('id').limit(PAGE_SIZE).execute().data or []
+
+        rows = []
+        for ticket in page:
+            for pos, leg in enumerate(ticket.get('legs') or []):
+                teams = settle_results._parse_match(leg.get('match') or '')
+                if teams is None or leg.get('result', 'Pending') != 'Pending':
+                    continue
+                rows.append((match_key(*teams), ticket['id'], pos, leg['match'], ticket.get('date') or ticket.get('created_at')))
+
+        with db.connection() as conn:
+            before = conn.total_changes
+            conn.executemany('''
+                INSERT OR IGNORE INTO ticket_leg_index (match_key, ticket_uuid, leg_pos, match, ticket_date)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+            indexed += conn.total_changes - before
+
+        if page:
+            cursor = (page[-1]['created_at'], page[-1]['id'])
+        if len(page) < PAGE_SIZE:
+            break
+
+    if cursor != watermark:
+        with db.connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)", (INDEX_WATERMARK, json.dumps(cursor)))
+    return indexed
+
+def _parse_watermark(value):
+    """Stored watermark -> (created_at, id); id is None for watermarks saved before ids were kept."""
+    try:
+        created_at, ticket_id = json.loads(value)
+    except (ValueError, TypeError):
+        created_at, ticket_id = value, None
+    return created_at, ticket_id
+
+def open_matches():
+    """Distinct open fixtures as pseudo-bets, so the score poller only polls what is exposed."""
+    with db.connection() as conn:
+        rows = conn.execute(
+            "SELECT match, MIN(ticket_date) AS placed FROM ticket_leg_index GROUP BY match_key"
+        ).fetchall()
+    return [{"date": r['placed'], "legs": [{"match": r['match']}]} for r in rows]
+
+def leg_result(event, leg):
+    """Maps a completed event to a leg result: 'Won', 'Half Won', 'Void', 'Half Lost' or 'Lost'."""
+    home_team, away_team = settle_results._parse_match(leg['match'])
+    outcome = settle_results.leg_outcome(event, leg.get('selection'), home_team, away_team)
+    if outcome is None:
+        return 'Pending'
+    return LEG_RESULTS[outcome]
+
+def ticket_outcome(ticket):
+    """(status, pnl) once every leg is decided or any leg lost; None while still open."""
+    legs = ticket['legs']
+    results = [leg.get('result', 'Pending') for leg in legs]
+    stake = float(ticket['stake'])
+    if 'Lost' in results:
+        return 'LOST', -stake
+    if 'Pending' in results:
+        return None
+
+    # Legs carrying their own odds settle exactly; the rest share the ticket's total_odds
+    payout_factor = settlement_kernel.ticket_payout_factor(
+        [LEG_OUTCOMES[r] for r in results], [leg.get('odds') for leg in legs], ticket.get('total_odds')
+    )
+    if payout_factor is None:
+        print(f"Ticket {ticket.get('ticket_id')}: winning leg has no odds and no total_odds; left PENDING.")
+        return None
+
+    pnl = round(stake * payout_factor - stake, 2)
+    if payout_factor > 1:
+        return 'WON', pnl
+    if payout_factor == 1:
+        return 'VOID', pnl
+    return 'LOST', pnl
 
 def run_settlement():
     print(f"[{datetime.now()}] Starting Settlement Engine (Cloud)...")
-    
-    # 1. Fetch PENDING tickets from Supabase
+
+    # 1. Index new tickets, then poll only the fixtures they are exposed to
     try:
-        response = supabase.table('parlay_tickets').select('*').eq('status', 'PENDING').execute()
-        tickets = response.data
+        print(f"Indexed {sync_ticket_index()} new open legs.")
     except Exception as e:
-        print(f"Error fetching tickets: {e}")
+        print(f"Error indexing tickets: {e}")
         return
 
-    if not tickets:
+    exposure = open_matches()
+    if not exposure:
         print("No pending tickets to settle.")
         return
+    events = [e for e in settle_results.poll_scores(exposure) if e.get('completed') and e.get('scores')]
 
-    updated_count = 0
+    # 2. Inverted lookup: completed match -> affected (ticket, leg)
+    affected = {} # ticket uuid -> {leg_pos: event}
+    with db.connection() as conn:
+        for event in events:
+            day = (event.get('commence_time') or '')[:10]
+            for row in conn.execute(
+                "SELECT ticket_uuid, leg_pos FROM ticket_leg_index WHERE match_key = ? AND substr(ticket_date, 1, 10) <= ?",
+                (match_key(event['home_team'], event['away_team']), day)
+            ):
+                affected.setdefault(row['ticket_uuid'], {})[row['leg_pos']] = event
+
+    if not affected:
+        print("No open legs on newly completed matches.")
+        return
 
+    # 3. Load only the affected tickets and apply leg results
+    ticket_ids = list(affected)
+    tickets = []
+    for start in range(0, len(ticket_ids), ID_FILTER_CHUNK_SIZE):
+        chunk = ticket_ids[start:start + ID_FILTER_CHUNK_SIZE]
+        tickets.extend(supabase.table('parlay_tickets').select('*').in_('id', chunk).execute().data or [])
+
+    updates = []
+    decided_legs = []
+    closed_tickets = []
     for ticket in tickets:
-        print(f"Checking Ticket {ticket['ticket_id']}...")
-        
-        # Check all legs
-        all_won = True
-        any_lost = False
-        
-        new_legs = []
-        original_legs = ticket['legs'] # It's already a dict/list from JSONB
-        
-        legs_changed = False
-        
-        for leg in original_legs:
-            result = leg.get('result', 'Pending')
-            if result == 'Pending':
-                # Try to fetch result
-                new_result = check_match_result(leg['match'], leg['selection'])
-                if new_result != result:
-                    leg['result'] = new_result
-                    legs_changed = True
-                    result = new_result
-            
-            new_legs.append(leg)
-
-            if result == 'Lost':
-                any_lost = True
-            if result == 'Pending':
-                all_won = False
-        
-        # Determine Status Change
-        new_status = ticket['status']
-        new_pnl = ticket['pnl']
-        
-        if any_lost:
-            new_status = 'LOST'
-            new_pnl = -float(ticket['stake'])
-        elif all_won:
-            new_status = 'WON'
-            payout = float(ticket['stake']) * float(ticket['total_odds'])
-            new_pnl = round(payout - float(ticket['stake']), 2)
-            
-        # Update DB if anything changed
-        if new_status != ticket['status'] or legs_changed:
-            payload = {
-                "status": new_status,
-                "pnl": new_pnl,
-                "legs": new_legs
-            }
-            try:
-                supabase.table('parlay_tickets').update(payload).eq('id', ticket['id']).execute()
-                print(f" -> Ticket {ticket['ticket_id']} Updated: {new_status}")
-                updated_count += 1
-            except Exception as e:
-                print(f"Failed to update ticket {ticket['ticket_id']}: {e}")
+        if ticket['status'] != 'PENDING':
+            closed_tickets.append(ticket['id'])
+            continue
+        legs = ticket['legs']
+        changed = False
+        for pos, event in affected[ticket['id']].items():
+            if pos < len(legs) and legs[pos].get('result', 'Pending') == 'Pending':
+                result = leg_result(event, legs[pos])
+                if result != 'Pending':
+                    legs[pos]['result'] = result
+                    decided_legs.append((ticket['id'], pos))
+                    changed = True
+
+        outcome = ticket_outcome(ticket)
+        if outcome:
+            ticket['status'], ticket['pnl'] = outcome
+            closed_tickets.append(ticket['id'])
+            print(f" -> Ticket {ticket['ticket_id']} Updated: {ticket['status']}")
+            changed = True
+        if changed: # Untouched tickets are not rewritten
+            updates.append(ticket)
+
+    # 4. Conditional bulk write (settle_pending_bets, payments_schema.sql): only tickets still
+    # PENDING are touched and only legs / status / pnl are written, so a concurrent settler
+    # can neither be overwritten nor have its settled ticket reopened
+    updated_count = 0
+    for start in range(0, len(updates), UPSERT_CHUNK_SIZE):
+        chunk = updates[start:start + UPSERT_CHUNK_SIZE]
+        try:
+            res = supabase.rpc('settle_pending_bets', {
+                'p_table': 'parlay_tickets',
+                'p_results': [_ticket_write(t) for t in chunk]
+            }).execute()
+        except Exception as e:
+            print(f"Failed to update {len(chunk)} tickets: {e}")
+            # Keep their index entries so the next run retries them
+            failed = {t['id'] for t in chunk}
+            decided_legs = [d for d in decided_legs if d[0] not in failed]
+            closed_tickets = [t for t in closed_tickets if t not in failed]
+            continue
+        written = {str(i) for i in settle_results._returned_ids(res.data)}
+        updated_count += len(written)
+        # Tickets the guard skipped were settled elsewhere: drop them from the index entirely
+        closed_tickets.extend(t['id'] for t in chunk if str(t['id']) not in written and t['status'] == 'PENDING')
+
+    with db.connection() as conn:
+        conn.executemany("DELETE FROM ticket_leg_index WHERE ticket_uuid = ? AND leg_pos = ?", decided_legs)
+        conn.executemany("DELETE FROM ticket_leg_index WHERE ticket_uuid = ?", [(t,) for t in closed_tickets])
 
     print(f"Settlement Complete. Updated {updated_count} tickets.")
 
+def _ticket_write(ticket):
+    """Changed columns only; status / pnl are sent once the ticket is decided."""
+    row = {"id": ticket['id'], "legs": ticket['legs']}
+    if ticket['status'] != 'PENDING':
+        row.update(status=ticket['status'], pnl=ticket['pnl'])
+    return row
+
 if __name__ == "__main__":
     run_settlement()
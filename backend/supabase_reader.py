@@ -0,0 +1,42 @@
+"""
+Projected, keyset-paginated reads from Supabase tables.
+
+- Only the requested columns are selected, so heavy jsonb columns (odds_data, models_data)
+  never leave the database unless a job asks for them.
+- Filters run server-side as ordinary query-builder calls.
+- Pages are ordered by a unique key and continued with key > last seen value (no OFFSET),
+  so every page costs the same and rows inserted mid-scan are neither skipped nor repeated.
+- stream_rows is a generator: memory is bounded by one page however large the result.
+"""
+
+PAGE_SIZE = 1000 # Supabase default max rows per select
+
+def stream_rows(client, table, columns='*', filters=(), key='id', page_size=PAGE_SIZE):
+    """
+    Yields every row of `table` matching `filters`, one page at a time.
+
+    filters are (method, column, value) tuples applied to the query builder, e.g.
+    ('eq', 'status', 'PENDING'), ('gte', 'match_time', '2026-01-01'), ('in_', 'id', ids).
+    `key` must be unique; it is added to the projection when missing.
+    """
+    fields = [c.strip() for c in columns.split(',')]
+    if '*' not in fields and key not in fields:
+        fields.insert(0, key)
+    projection = ', '.join(fields)
+
+    last = None
+    while True:
+        query = client.table(table).select(projection)
+        for method, column, value in filters:
+            query = getattr(query, method)(column, value)
+        if last is not None:
+            query = query.gt(key, last)
+        page = query.order(key).limit(page_size).execute().data or []
+        yield from page
+        if len(page) < page_size:
+            return
+        last = page[-1][key]
+
+def fetch_rows(client, table, columns='*', filters=(), key='id', page_size=PAGE_SIZE):
+    """stream_rows collected into a list, for callers that need every row at once."""
+    return list(stream_rows(client, table, columns, filters, key, page_size))
@@ -0,0 +1,50 @@
+
+import os
+import sys
+import uuid
+from dotenv import load_dotenv
+from supabase import create_client
+
+load_dotenv('backend/.env')
+
+supabase = create_client(
+    os.getenv('NEXT_PUBLIC_SUPABASE_URL'),
+    os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+)
+
+AMOUNT = 0.01
+
+def balance(user_id):
+    return float(supabase.table('profiles').select('balance').eq('id', user_id).single().execute().data['balance'] or 0)
+
+def credit(user_id, amount, ref):
+    return supabase.rpc('bulk_credit_users', {
+        'p_user_ids': [user_id],
+        'p_amounts': [amount],
+        'p_type': 'REWARD',
+        'p_desc': 'Credit idempotency check',
+        'p_ref': ref
+    }).execute().data
+
+print("\n--- bulk_credit_users: repeated transaction_ref ---")
+if len(sys.argv) > 1:
+    user_id = sys.argv[1]
+else:
+    user_id = supabase.table('profiles').select('id').limit(1).execute().data[0]['id']
+ref = f"idempotency_check_{uuid.uuid4().hex}"
+
+start = balance(user_id)
+first = credit(user_id, AMOUNT, ref)
+second = credit(user_id, AMOUNT, ref) # Same ref: must be skipped
+end = balance(user_id)
+rows = supabase.table('credit_transactions').select('id').eq('transaction_ref', ref).execute().data
+
+print(f"User: {user_id}")
+print(f"First call credited {first} user(s), replay credited {second}")
+print(f"Balance delta: {end - start:+.2f} (expected {AMOUNT:+.2f}), ledger rows: {len(rows)} (expected 1)")
+ok = first == 1 and second == 0 and round(end - start, 2) == AMOUNT and len(rows) == 1
+print("✅ Repeated ref did not double-credit" if ok else "❌ Repeated ref was credited more than once")
+
+# Undo the check's own credit under a separate ref
+credit(user_id, -AMOUNT, ref + "_reversal")
+sys.exit(0 if ok else 1)
@@ -60,3 +60,125 @@ begin
     where id = usr_id;
 end;
 $$ language plpgsql security definer;
+
+-- 6. Settlement columns & lookup index
+-- The engine settles every PENDING option on the day's matches in one pass
+do $$ 
+begin
+    if not exists (select 1 from information_schema.columns where table_name = 'black_swan_options' and column_name = 'payout') then
+        alter table black_swan_options add column payout numeric default 0;
+    end if;
+end $$;
+
+create index if not exists idx_options_pending_match on black_swan_options(match_id, id) where status = 'PENDING';
+
+-- 7. Achievement de-duplication (one row per model, type and day)
+-- The league engine reruns every scheduler tick and upserts on this key, so the table
+-- grows with distinct achievements rather than with run frequency.
+do $$ 
+begin
+    if not exists (select 1 from information_schema.columns where table_name = 'ai_achievements' and column_name = 'day') then
+        alter table ai_achievements add column day date;
+        update ai_achievements set day = coalesce(earned_at, now())::date;
+        alter table ai_achievements alter column day set default current_date;
+        alter table ai_achievements alter column day set not null;
+    end if;
+
+    if not exists (select 1 from pg_constraint where conname = 'ai_achievements_model_type_day_key') then
+        -- Keep the latest row of each existing duplicate group
+        delete from ai_achievements a
+        using ai_achievements b
+        where a.model_id is not distinct from b.model_id
+          and a.achievement_type = b.achievement_type
+          and a.day = b.day
+          and (a.earned_at, a.id) < (b.earned_at, b.id);
+
+        alter table ai_achievements
+            add constraint ai_achievements_model_type_day_key unique (model_id, achievement_type, day);
+    end if;
+end $$;
+
+-- 8. ATOMIC OPTION SETTLEMENT
+-- p_results is a jsonb array of {id, status, result, payout}. Only options still PENDING
+-- are flipped; each payout is logged under ref 'option:<id>' (skipped if already credited,
+-- see payments_schema.sql section 6), added to the holder's balance and rewarded with
+-- p_xp_per_payout XP, all in the same transaction. A failure leaves the options PENDING
+-- and unpaid, never settled-but-unpaid. Returns the number of options settled.
+create or replace function settle_black_swan_options(p_results jsonb, p_xp_per_payout numeric)
+returns integer as $$
+declare
+    settled_count integer;
+    paid_users uuid[];
+    paid_xp numeric[];
+begin
+    with settled as (
+        update black_swan_options o
+        set status = r.status, result = r.result, payout = coalesce(r.payout, 0)
+        from jsonb_to_recordset(p_results) as r(id uuid, status text, result text, payout numeric)
+        where o.id = r.id and o.status = 'PENDING'
+        returning o.id, o.user_id, o.payout
+    ),
+    logged as (
+        insert into credit_transactions (user_id, amount, type, description, transaction_ref)
+        select s.user_id, s.payout, 'HEDGE_PAYOUT', 'Black Swan option payout', 'option:' || s.id
+        from settled s
+        join profiles p on p.id = s.user_id
+        where s.payout > 0
+        on conflict (transaction_ref, user_id) do nothing
+        returning user_id, amount
+    ),
+    paid as (
+        update profiles p
+        set balance = coalesce(p.balance, 0) + c.amount
+        from (select user_id, sum(amount) as amount from logged group by user_id) c
+        where p.id = c.user_id
+        returning p.id
+    ),
+    payouts as (
+        select user_id, count(*) as n
+        from settled
+        where payout > 0 and user_id is not null
+        group by user_id
+    )
+    select (select count(*) from settled),
+           (select array_agg(user_id order by user_id) from payouts),
+           (select array_agg(n * p_xp_per_payout order by user_id) from payouts)
+    into settled_count, paid_users, paid_xp;
+
+    -- XP in its own statement: the CTEs above already update these profiles rows
+    if paid_users is not null then
+        perform bulk_award_user_xp(paid_users, paid_xp);
+    end if;
+
+    return settled_count;
+end;
+$$ language plpgsql security definer;
+
+-- 9. ONE ALPHA KING PER DAY
+-- Reruns that find a new top model move the day's crown instead of adding a second one.
+do $$ 
+begin
+    if not exists (select 1 from pg_indexes where indexname = 'ai_achievements_alpha_king_day_key') then
+        -- Keep the latest crown of each day
+        delete from ai_achievements a
+        using ai_achievements b
+        where a.achievement_type = 'Alpha King'
+          and b.achievement_type = 'Alpha King'
+          and a.day = b.day
+          and (a.earned_at, a.id) < (b.earned_at, b.id);
+    end if;
+end $$;
+
+create unique index if not exists ai_achievements_alpha_king_day_key
+    on ai_achievements(day) where achievement_type = 'Alpha King';
+
+-- Upsert on (day): PostgREST on_conflict cannot target the partial index above
+create or replace function crown_alpha_king(p_model_id text, p_day date, p_description text)
+returns void as $$
+    insert into ai_achievements (model_id, achievement_type, day, description)
+    values (p_model_id, 'Alpha King', p_day, p_description)
+    on conflict (day) where achievement_type = 'Alpha King'
+    do update set model_id = excluded.model_id,
+                  description = excluded.description,
+                  earned_at = now();
+$$ language sql security definer;
@@ -92,3 +92,62 @@ values
 ('The DeepSeek Stimulus', 'Increase DeepSeek V3 consensus weight by 20% to capitalize on recent tactical edge.', 'deepseek_v3', 0.20, 5000, now() + interval '3 days'),
 ('Claude Value Sanction', 'Reduce Claude Opus 4.5 weight by 15% due to excessive risk aversion in high-confidence streaks.', 'claude_opus_4_5', -0.15, 3000, now() + interval '2 days'),
 ('Aggressive Bankroll Shift', 'Shift 10% of total consensus bankroll towards GPT-5 High-Yield strategies.', 'gpt_5_preview', 0.10, 8000, now() + interval '5 days');
+
+-- 5. Bulk Settlement Helpers (daily job: one round trip)
+create index if not exists idx_governance_votes_proposal on governance_votes(proposal_id);
+
+-- Closes every expired ACTIVE proposal in ONE transaction: tallies governance_votes, flips the
+-- status (EXECUTED with a 7-day active window when YES wins and reaches the threshold, DEFEATED
+-- otherwise) and pays every voter's XP (50 base + 1 per 100 power spent) before committing.
+-- Only proposals this call actually closed are paid, so a concurrent or repeated run pays nothing twice.
+-- Requires bulk_award_user_xp (user_achievement_schema.sql). Returns the closed proposals.
+drop function if exists tally_expired_proposals(timestamptz);
+drop function if exists award_governance_xp(uuid);
+
+create or replace function tally_expired_proposals(p_today timestamptz)
+returns table (id uuid, title text, status text, yes_votes numeric, no_votes numeric, voters integer) as $$
+#variable_conflict use_column
+declare
+    closed_ids uuid[];
+begin
+    -- 1. Tally and close (the status re-check under the row lock skips proposals closed meanwhile)
+    with tally as (
+        select p.id,
+               coalesce(sum(v.power) filter (where v.vote_type = 'YES'), 0) as yes_power,
+               coalesce(sum(v.power) filter (where v.vote_type <> 'YES'), 0) as no_power,
+               coalesce(p.threshold, 1000) as threshold
+        from governance_proposals p
+        left join governance_votes v on v.proposal_id = p.id
+        where p.status = 'ACTIVE' and p.expires_at <= p_today
+        group by p.id
+    ),
+    closed as (
+        update governance_proposals p
+        set yes_votes = t.yes_power,
+            no_votes = t.no_power,
+            status = case when t.yes_power > t.no_power and t.yes_power >= t.threshold then 'EXECUTED' else 'DEFEATED' end,
+            active_from = case when t.yes_power > t.no_power and t.yes_power >= t.threshold then p_today else p.active_from end,
+            active_until = case when t.yes_power > t.no_power and t.yes_power >= t.threshold then p_today + interval '7 days' else p.active_until end
+        from tally t
+        where p.id = t.id and p.status = 'ACTIVE'
+        returning p.id
+    )
+    select array_agg(closed.id) into closed_ids from closed;
+
+    if closed_ids is null then
+        return;
+    end if;
+
+    -- 2. Voting XP for every voter of the closed proposals in one bulk call
+    perform bulk_award_user_xp(array_agg(v.user_id), array_agg(50 + trunc(v.power / 100)))
+    from governance_votes v
+    where v.proposal_id = any(closed_ids);
+
+    -- 3. Report
+    return query
+    select p.id, p.title, p.status, p.yes_votes, p.no_votes,
+           (select count(*)::integer from governance_votes v where v.proposal_id = p.id)
+    from governance_proposals p
+    where p.id = any(closed_ids);
+end;
+$$ language plpgsql security definer;
@@ -82,3 +82,72 @@ values
 ('Silver Shield', 'Defensive betting using black-swan hedging exclusively.', 'Capital Protection', 'Low Risk', 500, 4.2),
 ('Nexus Alpha', 'Quant-driven signals for European football.', 'Market Neutral', 'Medium Risk', 750, 8.8)
 on conflict do nothing;
+
+-- 6. MEMBER PNL ROLLUP (maintained incrementally)
+-- One row per user per settlement day; a trigger adds each bet as it leaves PENDING,
+-- so guild ROI aggregates a week of small rollup rows instead of scanning user_bets.
+create table if not exists user_daily_pnl (
+    user_id uuid not null,
+    day date not null,
+    stake numeric not null default 0,
+    pnl numeric not null default 0,
+    bets integer not null default 0,
+    primary key (user_id, day)
+);
+
+create index if not exists idx_user_daily_pnl_day on user_daily_pnl(day);
+create index if not exists idx_guild_memberships_user on guild_memberships(user_id);
+
+create or replace function rollup_settled_bet()
+returns trigger as $$
+begin
+    if new.status <> 'PENDING' and new.pnl is not null
+       and (tg_op = 'INSERT' or old.status = 'PENDING') then
+        insert into user_daily_pnl (user_id, day, stake, pnl, bets)
+        values (new.user_id, current_date, coalesce(new.stake, 0), new.pnl, 1)
+        on conflict (user_id, day) do update
+        set stake = user_daily_pnl.stake + excluded.stake,
+            pnl = user_daily_pnl.pnl + excluded.pnl,
+            bets = user_daily_pnl.bets + 1;
+    end if;
+    return new;
+end;
+$$ language plpgsql security definer;
+
+drop trigger if exists trg_rollup_settled_bet on user_bets;
+create trigger trg_rollup_settled_bet
+after insert or update of status on user_bets
+for each row execute function rollup_settled_bet();
+
+-- One-time backfill from bets settled before the trigger existed (dated by placement)
+insert into user_daily_pnl (user_id, day, stake, pnl, bets)
+select user_id, created_at::date, sum(coalesce(stake, 0)), sum(pnl), count(*)
+from user_bets
+where status <> 'PENDING' and pnl is not null
+  and not exists (select 1 from user_daily_pnl)
+group by user_id, created_at::date;
+
+-- 7. RPC: REFRESH GUILD ROI (every guild in one statement)
+-- roi_7d = members' settled PnL / stake over the 7 days ending p_today, in percent.
+create or replace function refresh_guild_roi(p_today date default current_date)
+returns integer as $$
+declare
+    updated integer;
+begin
+    update guilds g
+    set roi_7d = r.roi
+    from (
+        select g2.id,
+               coalesce(round(sum(d.pnl) / nullif(sum(d.stake), 0) * 100, 2), 0) as roi
+        from guilds g2
+        left join guild_memberships m on m.guild_id = g2.id
+        left join user_daily_pnl d on d.user_id = m.user_id
+            and d.day > p_today - 7 and d.day <= p_today
+        group by g2.id
+    ) r
+    where g.id = r.id and g.roi_7d is distinct from r.roi;
+
+    get diagnostics updated = row_count;
+    return updated;
+end;
+$$ language plpgsql security definer;
@@ -16,7 +16,7 @@ create table if not exists credit_transactions (
     id uuid primary key default uuid_generate_v4(),
     user_id uuid references auth.users(id),
     amount numeric not null, -- Positive for inflow, Negative for outflow
-    type text not null, -- 'PURCHASE', 'VOTE', 'HEDGE_PREMIUM', 'HEDGE_PAYOUT', 'REWARD', 'SUBSCRIPTION'
+    type text not null, -- 'PURCHASE', 'VOTE', 'HEDGE_PREMIUM', 'HEDGE_PAYOUT', 'REWARD', 'SUBSCRIPTION', 'BET_PAYOUT'
     description text,
     transaction_ref text, -- External ref (e.g., Stripe Session ID)
     created_at timestamptz default now()
@@ -41,13 +41,132 @@ create or replace function topup_user_credits(
     p_ref text
 ) returns void as $$
 begin
-    -- 1. Update Profile Balance
+    -- 1. Log Transaction (a ref already credited to this user is a retry: skip it)
+    insert into credit_transactions (user_id, amount, type, description, transaction_ref)
+    values (p_user_id, p_amount, p_type, p_desc, p_ref)
+    on conflict (transaction_ref, user_id) do nothing;
+    if not found then
+        return;
+    end if;
+
+    -- 2. Update Profile Balance
     update profiles 
     set balance = balance + p_amount
     where id = p_user_id;
+end;
+$$ language plpgsql security definer;
 
-    -- 2. Log Transaction
-    insert into credit_transactions (user_id, amount, type, description, transaction_ref)
-    values (p_user_id, p_amount, p_type, p_desc, p_ref);
+-- 5. BULK SETTLEMENT CREDITS (one call per settlement run)
+-- Arrays are paired by position: p_user_ids[i] receives p_amounts[i].
+-- Duplicate users are summed and every credit is logged and applied in one transaction.
+-- A (p_ref, user) pair already in credit_transactions is skipped, so rerunning a payout
+-- with the same ref never pays twice (see section 6).
+create or replace function bulk_credit_users(
+    p_user_ids uuid[],
+    p_amounts numeric[],
+    p_type text,
+    p_desc text,
+    p_ref text
+) returns integer as $$
+declare
+    credited integer;
+begin
+    if coalesce(array_length(p_user_ids, 1), 0) <> coalesce(array_length(p_amounts, 1), 0) then
+        raise exception 'bulk_credit_users: % user ids but % amounts',
+            coalesce(array_length(p_user_ids, 1), 0), coalesce(array_length(p_amounts, 1), 0);
+    end if;
+
+    with credits as (
+        select t.user_id, sum(t.amount) as amount
+        from unnest(p_user_ids, p_amounts) as t(user_id, amount)
+        group by t.user_id
+    ),
+    logged as (
+        insert into credit_transactions (user_id, amount, type, description, transaction_ref)
+        select c.user_id, c.amount, p_type, p_desc, p_ref
+        from credits c
+        join profiles p on p.id = c.user_id
+        on conflict (transaction_ref, user_id) do nothing
+        returning user_id, amount
+    )
+    update profiles p
+    set balance = coalesce(p.balance, 0) + l.amount
+    from logged l
+    where p.id = l.user_id;
+
+    get diagnostics credited = row_count;
+    return credited;
+end;
+$$ language plpgsql security definer;
+
+-- 6. IDEMPOTENT CREDITS
+-- One credit per (ref, user): reruns of a settlement or payout job skip what was already paid.
+-- Null refs (manual top-ups) stay unconstrained. Fails loudly if earlier double payments
+-- exist, since those need reconciling by hand rather than silently deleting ledger rows.
+do $$
+begin
+    if not exists (select 1 from pg_constraint where conname = 'credit_transactions_ref_user_key') then
+        alter table credit_transactions
+            add constraint credit_transactions_ref_user_key unique (transaction_ref, user_id);
+    end if;
+end $$;
+
+-- 7. ATOMIC BET SETTLEMENT
+-- p_results is a jsonb array of {id, status, pnl}; parlay_tickets rows may also carry legs
+-- (per-leg results), and omit status/pnl while the ticket stays open. Only rows still
+-- PENDING are written, so a repeated, late or concurrent resolution can never overwrite or
+-- reopen a bet that is already settled.
+-- For user_bets the payouts (stake + pnl) of the bets flipped here are summed per user and
+-- paid through ONE bulk_credit_users call under p_ref, in the same transaction: a failure
+-- rolls back status and credit together, and a replayed ref is skipped (section 6).
+-- Returns the ids actually settled by this call.
+drop function if exists settle_pending_bets(text, jsonb);
+create or replace function settle_pending_bets(p_table text, p_results jsonb, p_ref text default null)
+returns setof uuid as $$
+declare
+    settled_ids uuid[];
+    paid_users uuid[];
+    paid_amounts numeric[];
+begin
+    if p_table = 'parlay_tickets' then
+        return query
+        update parlay_tickets t
+        set legs = coalesce(r.legs, t.legs),
+            status = coalesce(r.status, t.status),
+            pnl = coalesce(r.pnl, t.pnl)
+        from jsonb_to_recordset(p_results) as r(id uuid, legs jsonb, status text, pnl numeric)
+        where t.id = r.id and t.status = 'PENDING'
+        returning t.id;
+        return;
+    end if;
+
+    if p_table <> 'user_bets' then
+        raise exception 'settle_pending_bets: unsupported table %', p_table;
+    end if;
+
+    with settled as (
+        update user_bets t
+        set status = r.status, pnl = r.pnl
+        from jsonb_to_recordset(p_results) as r(id uuid, status text, pnl numeric)
+        where t.id = r.id and t.status = 'PENDING'
+        returning t.id, t.user_id, coalesce(t.stake, 0) + r.pnl as payout
+    ),
+    credits as (
+        select user_id, round(sum(payout), 2) as amount
+        from settled
+        where payout > 0 and user_id is not null
+        group by user_id
+    )
+    select (select array_agg(id) from settled),
+           (select array_agg(user_id order by user_id) from credits),
+           (select array_agg(amount order by user_id) from credits)
+    into settled_ids, paid_users, paid_amounts;
+
+    -- Credit in its own statement, still inside this function's transaction
+    if paid_users is not null then
+        perform bulk_credit_users(paid_users, paid_amounts, 'BET_PAYOUT', 'Bet settlement payout', p_ref);
+    end if;
+
+    return query select unnest(coalesce(settled_ids, '{}'::uuid[]));
 end;
 $$ language plpgsql security definer;
@@ -86,3 +86,49 @@ begin
     where id = p_user_id;
 end;
 $$ language plpgsql security definer;
+
+-- 5. BULK XP AWARDING (one call for many users)
+-- Arrays are paired by position: p_user_ids[i] earns p_xp_amounts[i]. Duplicate users are
+-- summed; the Pro multiplier and level thresholds match award_user_xp.
+create or replace function bulk_award_user_xp(
+    p_user_ids uuid[],
+    p_xp_amounts numeric[]
+) returns integer as $$
+declare
+    awarded integer;
+begin
+    if coalesce(array_length(p_user_ids, 1), 0) <> coalesce(array_length(p_xp_amounts, 1), 0) then
+        raise exception 'bulk_award_user_xp: % user ids but % amounts',
+            coalesce(array_length(p_user_ids, 1), 0), coalesce(array_length(p_xp_amounts, 1), 0);
+    end if;
+
+    update profiles p
+    set xp = n.new_xp,
+        rank_level = case
+            when n.new_xp >= 20000 then 4
+            when n.new_xp >= 5000 then 3
+            when n.new_xp >= 1000 then 2
+            else 1
+        end,
+        governor_title = case
+            when n.new_xp >= 20000 then 'Prime Governor'
+            when n.new_xp >= 5000 then 'Council Member'
+            when n.new_xp >= 1000 then 'Senior Researcher'
+            else 'Apprentice Analyst'
+        end
+    from (
+        select pr.id,
+               coalesce(pr.xp, 0) + a.xp_amount * (case when pr.is_pro then 1.2 else 1 end) as new_xp
+        from (
+            select t.user_id, sum(t.xp_amount) as xp_amount
+            from unnest(p_user_ids, p_xp_amounts) as t(user_id, xp_amount)
+            group by t.user_id
+        ) a
+        join profiles pr on pr.id = a.user_id
+    ) n
+    where p.id = n.id;
+
+    get diagnostics awarded = row_count;
+    return awarded;
+end;
+$$ language plpgsql security definer;